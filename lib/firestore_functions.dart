@@ -1,6 +1,7 @@
 import 'package:cloud_firestore/cloud_firestore.dart';
 import 'token_data.dart';
 import 'dart:convert';
+import 'dart:typed_data';
 
 Future<List<TokenData>> fetchDocuments() async {
   // Reference to the collection
@@ -118,8 +119,11 @@ Future<List<Map<String, dynamic>>> fetchChartData(
 
     if (docSnapshot.exists) {
       final data = docSnapshot.data();
-      if (data != null && data.containsKey(timeframeKey) && data[timeframeKey] is List) {
-        final List<Map<String, dynamic>> chartData = List<Map<String, dynamic>>.from(data[timeframeKey]);
+      final bool isCompact = data != null && data['encoding'] == 'compact_v1';
+      if (data != null && (isCompact || (data.containsKey(timeframeKey) && data[timeframeKey] is List))) {
+        final List<Map<String, dynamic>> chartData = isCompact
+            ? decodeCompactChart(data, timeframeKey)
+            : List<Map<String, dynamic>>.from(data[timeframeKey]);
 
         // 3. Save to Cookie Cache
         try {
@@ -145,6 +149,46 @@ Future<List<Map<String, dynamic>>> fetchChartData(
   }
 }
 
+// Decodes one range of a 'compact_v1' chart document (written by
+// python_scripts/chart_encoding.py) into the {timestamp, open} maps of the legacy layout.
+List<Map<String, dynamic>> decodeCompactChart(Map<String, dynamic> data, String timeframeKey) {
+  final ranges = data['ranges'] as Map<String, dynamic>?;
+  final range = ranges?[timeframeKey] as Map<String, dynamic>?;
+  if (range == null) {
+    return [];
+  }
+
+  final Map<String, dynamic> series;
+  List<int>? indices;
+  if (range.containsKey('series')) {
+    series = data[range['series']] as Map<String, dynamic>;
+    final idx = _blobBytes(range['idx']);
+    indices = List<int>.generate(idx.length ~/ 2, (i) => idx.getUint16(i * 2, Endian.little));
+  } else {
+    series = range;
+  }
+
+  final deltas = _blobBytes(series['dt']);
+  final opens = _blobBytes(series['open']);
+  final int count = deltas.lengthInBytes ~/ 4;
+  final timestamps = List<int>.filled(count, 0);
+  int current = (series['t0'] as num).toInt();
+  for (int i = 0; i < count; i++) {
+    current += deltas.getUint32(i * 4, Endian.little);
+    timestamps[i] = current;
+  }
+
+  return (indices ?? List<int>.generate(count, (i) => i)).map((i) => <String, dynamic>{
+    'timestamp': DateTime.fromMillisecondsSinceEpoch(timestamps[i] * 1000, isUtc: true).toIso8601String(),
+    'open': opens.getFloat64(i * 8, Endian.little),
+  }).toList();
+}
+
+ByteData _blobBytes(dynamic value) {
+  final Uint8List bytes = value is Blob ? value.bytes : Uint8List.fromList(List<int>.from(value as List));
+  return ByteData.sublistView(bytes);
+}
+
 void errorLogger(String errorMessage, String location) {
   try {
     FirebaseFirestore.instance.collection('error_logs').add({
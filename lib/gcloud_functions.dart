@@ -106,9 +106,11 @@ Future<Map<String, dynamic>> getJupiterQuote(String outputTokenMint, double SOLA
     }
 }
 
-Future <String> sendTransactionSolana(String signedTransactionBase64) async {
+// With waitForConfirmation = false the gcloud function returns the signature as soon as
+// the transaction is submitted; use waitForSolanaConfirmation to follow it.
+Future <String> sendTransactionSolana(String signedTransactionBase64, {bool waitForConfirmation = true}) async {
     String fullUrl = _baseUrl + "?function=send_transaction_Solana";
-    final uri = Uri.parse('$fullUrl&signed_transaction_base64=$signedTransactionBase64');
+    final uri = Uri.parse('$fullUrl&signed_transaction_base64=$signedTransactionBase64&wait_for_confirmation=$waitForConfirmation');
 
     try {
         final response = await http.get(uri);
@@ -127,4 +129,50 @@ Future <String> sendTransactionSolana(String signedTransactionBase64) async {
         print('Error: $e');
         throw Exception('Error calling gcloud function send_transaction_Solana: $e');
     }
-}
\ No newline at end of file
+}
+
+// Returns the status of each signature, or null for signatures the cluster has not seen yet.
+Future<Map<String, dynamic>> getTransactionStatus(List<String> signatures) async {
+    String fullUrl = _baseUrl + "?function=get_transaction_status";
+    final uri = Uri.parse('$fullUrl&signatures=${signatures.join(',')}');
+
+    try {
+        final response = await http.get(uri);
+
+        if (response.statusCode == 200) {
+            final jsonResponse = jsonDecode(response.body);
+            return jsonResponse['statuses'] as Map<String, dynamic>;
+        } else {
+            // Handle the error here
+            print('Request failed with status: ${response.statusCode}.');
+            print('Response body: ${response.body}');
+            throw Exception('Failed to fetch Solana transaction status.');
+        }
+    } catch (e) {
+        print('Error: $e');
+        throw Exception('Error calling gcloud function get_transaction_status: $e');
+    }
+}
+
+// Polls get_transaction_status until the transaction is confirmed, fails, or times out.
+Future<String> waitForSolanaConfirmation(String signature, {Duration pollInterval = const Duration(seconds: 2), Duration timeout = const Duration(seconds: 60)}) async {
+    final deadline = DateTime.now().add(timeout);
+
+    while (DateTime.now().isBefore(deadline)) {
+        final statuses = await getTransactionStatus([signature]);
+        if (statuses.containsKey('error')) {
+            throw Exception('Error checking Solana transaction: ${statuses['error']}');
+        }
+        final status = statuses[signature];
+        if (status != null) {
+            if (status['err'] != null) {
+                throw Exception('Solana transaction failed: ${status['err']}');
+            }
+            if (status['confirmation_status'] == 'confirmed' || status['confirmation_status'] == 'finalized') {
+                return signature;
+            }
+        }
+        await Future.delayed(pollInterval);
+    }
+    throw Exception('Timed out waiting for Solana transaction confirmation.');
+}
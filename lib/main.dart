@@ -405,10 +405,10 @@ class _TokenQuestPageState extends State<TokenQuestPage> {
                                   mainAxisSize: MainAxisSize.min,
                                   children: [
                                     // Conditional logic for displaying the logo
-                                    if (token.firebaseLogoUrl != null && token.firebaseLogoUrl!.isNotEmpty)
+                                    if (token.iconLogoUrl != null && token.iconLogoUrl!.isNotEmpty)
                                       ClipOval(
                                         child: CachedNetworkImage( // Changed to CachedNetworkImage
-                                          imageUrl: token.firebaseLogoUrl!, // Access directly
+                                          imageUrl: token.iconLogoUrl!, // Small thumbnail when available
                                           width: 25,
                                           height: 25,
                                           fit: BoxFit.cover,
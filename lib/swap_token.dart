@@ -256,7 +256,8 @@ class _SwapTokenState extends State<SwapToken> {
 
             if (signedTransactionBase64.isNotEmpty) {
               print("Sending Solana transaction via gcloud");
-              final signature = await sendTransactionSolana(signedTransactionBase64);
+              final submittedSignature = await sendTransactionSolana(signedTransactionBase64, waitForConfirmation: false);
+              final signature = await waitForSolanaConfirmation(submittedSignature);
 
               // Assuming 'signature' is the transaction hash/ID upon success
               if (signature != null) {
@@ -10,6 +10,7 @@ class TokenData {
   final String? websiteLink;
   final String? twitterLink;
   final String? firebaseLogoUrl;
+  final String? firebaseLogoSmallUrl; // Small thumbnail for list/grid icons
   final String? timestamp; // Changed to String? to match your Firestore data type
 
   TokenData({
@@ -22,9 +23,14 @@ class TokenData {
     this.websiteLink,
     this.twitterLink,
     this.firebaseLogoUrl,
+    this.firebaseLogoSmallUrl,
     this.timestamp,
   });
 
+  // Smallest available logo, for icon-sized display
+  String? get iconLogoUrl =>
+      (firebaseLogoSmallUrl != null && firebaseLogoSmallUrl!.isNotEmpty) ? firebaseLogoSmallUrl : firebaseLogoUrl;
+
   // Factory constructor to create a TokenData object from a Firestore document map
   factory TokenData.fromFirestore(Map<String, dynamic> doc) {
     return TokenData(
@@ -37,6 +43,7 @@ class TokenData {
       websiteLink: doc['website_link'] as String?,
       twitterLink: doc['twitter_link'] as String?,
       firebaseLogoUrl: doc['firebase_logo_url'] as String?,
+      firebaseLogoSmallUrl: doc['firebase_logo_small_url'] as String?,
       timestamp: doc['timestamp'] as String?, // Ensure this matches Firestore type
     );
   }
@@ -53,6 +60,7 @@ class TokenData {
       'website_link': websiteLink,
       'twitter_link': twitterLink,
       'firebase_logo_url': firebaseLogoUrl,
+      'firebase_logo_small_url': firebaseLogoSmallUrl,
       'timestamp': timestamp,
     };
   }
@@ -69,6 +77,7 @@ class TokenData {
       websiteLink: json['website_link'] as String?,
       twitterLink: json['twitter_link'] as String?,
       firebaseLogoUrl: json['firebase_logo_url'] as String?,
+      firebaseLogoSmallUrl: json['firebase_logo_small_url'] as String?,
       timestamp: json['timestamp'] as String?,
     );
   }
@@ -0,0 +1,192 @@
+import os
+import struct
+
+from ohlcv_series import FIELDS, CandleSeries, format_timestamp
+
+# --- Compact Chart Encoding ---
+# Optional storage layout for charts/{contract} documents. Instead of six arrays of
+# {timestamp, open} maps (five of them overlapping slices of the same hourly data),
+# a compact document stores the open prices of each source series once:
+#
+#   {'encoding': 'compact_v1',
+#    'minute': {'t0': <epoch>, 'dt': <bytes>, 'open': <bytes>},
+#    'hourly': {'t0': <epoch>, 'dt': <bytes>, 'open': <bytes>},
+#    'ranges': {'data_6h': {'series': 'hourly', 'idx': <bytes>}, ...}}
+#
+# 'dt' holds little-endian uint32 deltas in seconds from the previous timestamp
+# (the first delta is from t0, so it is 0). Price columns are little-endian float64. A range lists little-endian uint16 indices into its source
+# series; a range whose points are not all present in the source is stored inline
+# as its own {'t0', 'dt', 'open'} series instead. Byte fields are stored as
+# Firestore blobs.
+
+COMPACT_ENCODING = 'compact_v1'
+# "legacy" (default) writes the original layout; "compact" writes the layout above.
+CHART_STORAGE_FORMAT = os.environ.get("CHART_STORAGE_FORMAT", "legacy")
+
+
+def _pack(fmt: str, values) -> bytes:
+    return struct.pack(f'<{len(values)}{fmt}', *values)
+
+
+def _unpack(fmt: str, blob: bytes) -> tuple:
+    size = struct.calcsize(fmt)
+    return struct.unpack(f'<{len(blob) // size}{fmt}', bytes(blob))
+
+
+def _encode_series(series: CandleSeries, fields) -> dict:
+    timestamps = [int(ts) for ts in series.timestamps]
+    t0 = timestamps[0] if timestamps else 0
+    deltas = [ts - prev for prev, ts in zip([t0] + timestamps, timestamps)]
+    encoded = {'t0': t0, 'dt': _pack('I', deltas)}
+    for field in fields:
+        encoded[field] = _pack('d', [float(value) for value in getattr(series, field)])
+    return encoded
+
+
+def _decode_series(encoded: dict) -> CandleSeries:
+    timestamps = []
+    current = encoded.get('t0', 0)
+    for delta in _unpack('I', encoded.get('dt', b'')):
+        current += delta
+        timestamps.append(current)
+    columns = {}
+    for field in FIELDS:
+        if field in encoded:
+            columns[field] = _unpack('d', encoded[field])
+    opens = columns.get('open', ())
+    # Series stored with opens only (minute data) use them for high/low/close.
+    return CandleSeries(
+        timestamps,
+        opens,
+        columns.get('high', opens),
+        columns.get('low', opens),
+        columns.get('close', opens),
+        columns.get('volume', (0.0,) * len(opens)),
+    )
+
+
+def _encode_range(points: CandleSeries, source_name: str, source: CandleSeries) -> dict:
+    positions = {int(ts): i for i, ts in enumerate(source.timestamps)}
+    indices = []
+    for i in range(len(points)):
+        index = positions.get(int(points.timestamps[i]))
+        # Resampled candles that no longer match a source candle are stored inline.
+        if index is None or float(source.open[index]) != float(points.open[i]):
+            return _encode_series(points, ('open',))
+        indices.append(index)
+    return {'series': source_name, 'idx': _pack('H', indices)}
+
+
+def encode_chart_document(minute: CandleSeries, hourly: CandleSeries, charts: dict) -> dict:
+    """
+    Encodes the job's minute and hourly series plus the thinned data_* charts
+    (key -> CandleSeries) into a compact document.
+    """
+    sources = {'minute': minute, 'hourly': hourly}
+    ranges = {}
+    for key, points in charts.items():
+        source_name = 'minute' if key == 'data_1h' else 'hourly'
+        ranges[key] = _encode_range(points, source_name, sources[source_name])
+    return {
+        'encoding': COMPACT_ENCODING,
+        'minute': _encode_series(minute, ('open',)),
+        'hourly': _encode_series(hourly, ('open',)),
+        'ranges': ranges,
+    }
+
+
+def decode_source_series(document: dict) -> tuple[CandleSeries, CandleSeries]:
+    """The (minute, hourly) series of a compact document, without expanding the ranges."""
+    return _decode_series(document.get('minute', {})), _decode_series(document.get('hourly', {}))
+
+
+def decode_chart_document(document: dict) -> dict:
+    """Inverse of encode_chart_document, returning the legacy layout (data_* arrays)."""
+    minute, hourly = decode_source_series(document)
+    sources = {'minute': minute, 'hourly': hourly}
+    decoded = {}
+    for key, encoded in document.get('ranges', {}).items():
+        if 'series' in encoded:
+            points = sources[encoded['series']].take(list(_unpack('H', encoded.get('idx', b''))))
+        else:
+            points = _decode_series(encoded)
+        decoded[key] = points.to_points('open')
+    return decoded
+
+
+def build_chart_document(minute: CandleSeries, hourly: CandleSeries, charts: dict) -> dict:
+    """
+    The client-facing document to write for the configured CHART_STORAGE_FORMAT. The
+    hourly ring and job state go to chart_state/{contract} instead (see chart_state.py).
+    """
+    if CHART_STORAGE_FORMAT == 'compact':
+        return encode_chart_document(minute, hourly, charts)
+    return {key: points.to_points('open') for key, points in charts.items()}
+
+
+# --- Benchmark ---
+# python chart_encoding.py compares document size and encode/decode time of both
+# layouts on a synthetic two-week chart.
+
+def _firestore_size(value) -> int:
+    """Stored size per Firestore's documented rules (strings len + 1, numbers 8, bytes len)."""
+    if isinstance(value, dict):
+        return sum(len(key.encode()) + 1 + _firestore_size(item) for key, item in value.items())
+    if isinstance(value, list):
+        return sum(_firestore_size(item) for item in value)
+    if isinstance(value, str):
+        return len(value.encode()) + 1
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if value is None or isinstance(value, bool):
+        return 1
+    return 8
+
+
+if __name__ == '__main__':
+    import random
+    import time
+
+    from ohlcv_series import parse_timestamp
+
+    now = (int(time.time()) // 3600) * 3600
+    price = 0.0001
+    hourly_candles, minute_candles = [], []
+    for i in range(336, 0, -1):
+        price *= 1 + random.uniform(-0.05, 0.05)
+        hourly_candles.append({'timestamp': format_timestamp(now - i * 3600), 'open': price,
+                               'high': price * 1.02, 'low': price * 0.98, 'close': price,
+                               'volume': random.uniform(1e3, 1e6)})
+    for i in range(60, 0, -1):
+        minute_candles.append({'timestamp': format_timestamp(now - i * 60), 'open': price * random.uniform(0.99, 1.01)})
+    hourly = CandleSeries.from_candles(hourly_candles)
+    minute = CandleSeries.from_candles(minute_candles)
+    charts = {'data_1h': minute}
+    for key, hours, points in (('data_6h', 6, 120), ('data_12h', 12, 120), ('data_1d', 24, 144),
+                               ('data_1w', 168, 120), ('data_2w', 336, 168)):
+        charts[key] = hourly.since(now - hours * 3600).lttb(points)
+
+    legacy = {key: points.to_points('open') for key, points in charts.items()}
+    compact = encode_chart_document(minute, hourly, charts)
+
+    decoded = decode_chart_document(compact)
+    assert decoded == legacy
+
+    rounds = 200
+
+    def timed(fn) -> float:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        return (time.perf_counter() - start) / rounds * 1000
+
+    legacy_encode_ms = timed(lambda: {key: points.to_points('open') for key, points in charts.items()})
+    legacy_parse_ms = timed(lambda: [CandleSeries.from_candles(legacy[key]) for key in charts])
+    compact_encode_ms = timed(lambda: encode_chart_document(minute, hourly, charts))
+    compact_decode_ms = timed(lambda: decode_chart_document(compact))
+    compact_load_ms = timed(lambda: decode_source_series(compact))
+
+    print(f"legacy document:  {_firestore_size(legacy):>7} bytes, encode {legacy_encode_ms:.3f} ms, parse {legacy_parse_ms:.3f} ms")
+    print(f"compact document: {_firestore_size(compact):>7} bytes, encode {compact_encode_ms:.3f} ms, "
+          f"decode to legacy {compact_decode_ms:.3f} ms, load series {compact_load_ms:.3f} ms")
+    assert parse_timestamp(decoded['data_2w'][-1]['timestamp']) == int(hourly.timestamps[-1])
@@ -0,0 +1,193 @@
+import datetime
+import os
+import threading
+import time
+
+from http_transport import backoff_delay
+from chart_encoding import COMPACT_ENCODING, decode_source_series
+from ohlcv_series import CandleSeries
+
+# --- Chart State ---
+# Everything the chart job needs between runs for one token, prefetched together with
+# the rest of its token batch. It lives in a server-only chart_state/{contract}
+# document (hourly ring, minute candles, last price, refresh time), so the
+# client-facing charts/{contract} document carries only the six data_* arrays the
+# app downloads. Candles are held as columnar CandleSeries, so merging,
+# deduplicating, sorting and "latest candle" lookups work on epoch integers and
+# never re-parse ISO strings.
+
+CHARTS_COLLECTION = 'charts'
+CHART_STATE_COLLECTION = 'chart_state'
+# Two weeks in hours
+TWO_WEEKS_HOURS = 336
+MINUTE_CANDLES_KEPT = 60
+# Documents requested per get_all call when prefetching a batch of charts.
+CHART_PREFETCH_CHUNK = 100
+# Firestore's limit on writes in a single batch commit (used when BulkWriter is unavailable).
+MAX_WRITES_PER_BATCH = 500
+CHART_WRITE_MAX_ATTEMPTS = int(os.environ.get("CHART_WRITE_MAX_ATTEMPTS", "5"))
+
+
+def epoch_to_datetime(epoch: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(epoch, tz=datetime.timezone.utc)
+
+
+class ChartState:
+
+    def __init__(self, contract_address: str, data: dict | None = None):
+        self.contract_address = contract_address
+        self.exists = data is not None
+        data = data or {}
+        # USD price seen when the chart was last refreshed, for the dirty-token pre-pass
+        self.last_price = data.get('last_price')
+        self.refreshed_at = datetime.datetime.fromisoformat(data['refreshed_at']) if data.get('refreshed_at') else None
+        if data.get('encoding') == COMPACT_ENCODING:
+            # Compact charts/{contract} document from before the state was split out
+            self.minute, self.hourly = decode_source_series(data)
+            return
+        # 1-minute candles for data_1h (stored with timestamp and open only); charts
+        # documents from before the split kept them in data_1h itself.
+        self.minute = CandleSeries.from_candles(data.get('minute_candles', data.get('data_1h', [])))
+        # The two-week hourly ring
+        self.hourly = CandleSeries.from_candles(data.get('hourly_ring', []))
+
+    @staticmethod
+    def _get_all(db, collection_name: str, contract_addresses: list[str]) -> dict[str, dict]:
+        """{contract: document} for the documents that exist, read with get_all in chunks."""
+        documents = {}
+        collection = db.collection(collection_name)
+        for i in range(0, len(contract_addresses), CHART_PREFETCH_CHUNK):
+            refs = [collection.document(address) for address in contract_addresses[i:i + CHART_PREFETCH_CHUNK]]
+            try:
+                for doc in db.get_all(refs):
+                    if doc.exists:
+                        documents[doc.id] = doc.to_dict()
+            except Exception as e:
+                print(f"Error prefetching {collection_name} documents: {e}")
+        return documents
+
+    @classmethod
+    def load_many(cls, db, contract_addresses: list[str]) -> dict[str, "ChartState"]:
+        """
+        Prefetches the chart_state documents of a whole token batch with get_all, in
+        chunks. Tokens without one fall back to their charts document (written before
+        the state was split out), read the same way. Every requested address gets a
+        state; missing or unreadable documents are empty.
+        """
+        documents = cls._get_all(db, CHART_STATE_COLLECTION, contract_addresses)
+        missing = [address for address in contract_addresses if address not in documents]
+        if missing:
+            documents.update(cls._get_all(db, CHARTS_COLLECTION, missing))
+        return {address: cls(address, documents.get(address)) for address in contract_addresses}
+
+    # --- Query windows ---
+
+    def minute_query_start(self, now: datetime.datetime) -> datetime.datetime:
+        """One minute after the newest stored 1-minute candle, but never more than an hour back."""
+        one_hour_ago = now - datetime.timedelta(hours=1)
+        if not len(self.minute):
+            return one_hour_ago
+        latest = epoch_to_datetime(self.minute.last_timestamp)
+        return max(latest + datetime.timedelta(minutes=1), one_hour_ago)
+
+    def hourly_query_start(self, now: datetime.datetime) -> datetime.datetime:
+        """
+        The newest stored hourly candle (it may have been incomplete when fetched), or
+        the full two-week window when there is no ring yet.
+        """
+        two_weeks_ago = now - datetime.timedelta(hours=TWO_WEEKS_HOURS)
+        if not len(self.hourly):
+            return two_weeks_ago
+        return max(epoch_to_datetime(self.hourly.last_timestamp), two_weeks_ago)
+
+    # --- Merge and prune ---
+
+    def merge_minute(self, new_minute_data: CandleSeries):
+        self.minute = self.minute.merge(new_minute_data)
+
+    def merge_hourly(self, new_hourly_data: CandleSeries):
+        self.hourly = self.hourly.merge(new_hourly_data)
+
+    def prune(self, now: datetime.datetime):
+        self.minute = self.minute.tail(MINUTE_CANDLES_KEPT)
+        self.hourly = self.hourly.since(int(now.timestamp()) - TWO_WEEKS_HOURS * 3600)
+
+    def to_document(self, now: datetime.datetime) -> dict:
+        """The chart_state document, stamped with the price and time of this refresh."""
+        return {
+            'minute_candles': self.minute.to_points('open'),
+            'hourly_ring': self.hourly.to_candles(),
+            'last_price': self.last_price,
+            'refreshed_at': now.isoformat(),
+        }
+
+    def save(self, writer: "ChartWriter", document: dict, now: datetime.datetime):
+        """Queues the client-facing chart document and this state, each as one whole-document write."""
+        writer.set(self.contract_address, document)
+        writer.set_document(writer.document_ref(CHART_STATE_COLLECTION, self.contract_address), self.to_document(now))
+
+
+class ChartWriter:
+    """
+    Collects the chart job's document writes (charts, chart state and pair index
+    entries) from all worker threads and sends them through Firestore's BulkWriter,
+    which batches them, ramps up throughput gradually (backpressure) and retries
+    failed writes. Clients without bulk_writer() fall back
+    to batch commits chunked to MAX_WRITES_PER_BATCH with retries.
+    """
+
+    def __init__(self, db):
+        self._db = db
+        self._lock = threading.Lock()
+        self._pending = []
+        self._bulk_writer = db.bulk_writer() if hasattr(db, 'bulk_writer') else None
+        if self._bulk_writer is not None:
+            self._bulk_writer.on_write_error(self._on_write_error)
+
+    @staticmethod
+    def _on_write_error(failure, bulk_writer) -> bool:
+        if failure.attempts < CHART_WRITE_MAX_ATTEMPTS:
+            return True
+        print(f"CRITICAL: Error saving document {failure.operation.reference.path}: {failure.message}")
+        return False
+
+    def document_ref(self, collection_name: str, doc_id: str):
+        return self._db.collection(collection_name).document(doc_id)
+
+    def set(self, contract_address: str, document: dict):
+        self.set_document(self.document_ref(CHARTS_COLLECTION, contract_address), document)
+
+    def set_document(self, ref, document: dict):
+        with self._lock:
+            if self._bulk_writer is not None:
+                self._bulk_writer.set(ref, document)
+                return
+            self._pending.append((ref, document))
+            if len(self._pending) >= MAX_WRITES_PER_BATCH:
+                pending, self._pending = self._pending, []
+            else:
+                return
+        self._commit(pending)
+
+    def _commit(self, writes: list):
+        for attempt in range(CHART_WRITE_MAX_ATTEMPTS):
+            batch = self._db.batch()
+            for ref, document in writes:
+                batch.set(ref, document)
+            try:
+                batch.commit()
+                return
+            except Exception as e:
+                print(f"Error committing {len(writes)} documents (attempt {attempt + 1}): {e}")
+                time.sleep(backoff_delay(attempt))
+        print(f"CRITICAL: Giving up on {len(writes)} documents.")
+
+    def close(self):
+        """Flushes every queued write and waits for them to finish."""
+        if self._bulk_writer is not None:
+            self._bulk_writer.close()
+            return
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for i in range(0, len(pending), MAX_WRITES_PER_BATCH):
+            self._commit(pending[i:i + MAX_WRITES_PER_BATCH])
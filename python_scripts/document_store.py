@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+
+# --- Document Store ---
+# Base for the small persistent indexes the jobs keep between runs (pair_index.py,
+# metadata_cache.py, logo_index.py). Documents live in one Firestore collection, or
+# in a local JSON file of {doc_id: document} when a path is given, so the jobs can run
+# offline. Subclasses map their own keys to document IDs.
+
+# Documents per get_all call / writes per batch commit
+DOCUMENT_STORE_READ_CHUNK = 100
+DOCUMENT_STORE_WRITE_CHUNK = 500
+
+
+class DocumentStore:
+    """doc_id -> dict in the given Firestore collection, or in the JSON file at path."""
+
+    def __init__(self, collection: str, db=None, path: str = ""):
+        self.collection = collection
+        self._db = db
+        self._path = path
+        self._lock = threading.Lock()
+        self._local = {}
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                self._local = json.load(f)
+
+    @property
+    def is_local(self) -> bool:
+        return bool(self._path) or self._db is None
+
+    def document_ref(self, doc_id: str):
+        """Firestore reference of a document, for callers that batch their own writes."""
+        return self._db.collection(self.collection).document(doc_id)
+
+    def get_document(self, doc_id: str) -> dict | None:
+        if self.is_local:
+            with self._lock:
+                return self._local.get(doc_id)
+        try:
+            doc = self.document_ref(doc_id).get()
+            return doc.to_dict() if doc.exists else None
+        except Exception as e:
+            print(f"Error reading {self.collection}/{doc_id}: {e}")
+            return None
+
+    def get_documents(self, doc_ids: list[str]) -> dict[str, dict]:
+        """{doc_id: document} for the documents that exist, read with chunked get_all calls."""
+        if self.is_local:
+            with self._lock:
+                return {doc_id: self._local[doc_id] for doc_id in doc_ids if doc_id in self._local}
+        documents = {}
+        doc_ids = list(dict.fromkeys(doc_ids))
+        for i in range(0, len(doc_ids), DOCUMENT_STORE_READ_CHUNK):
+            refs = [self.document_ref(doc_id) for doc_id in doc_ids[i:i + DOCUMENT_STORE_READ_CHUNK]]
+            try:
+                for doc in self._db.get_all(refs):
+                    if doc.exists:
+                        documents[doc.id] = doc.to_dict()
+            except Exception as e:
+                print(f"Error reading {self.collection}: {e}")
+        return documents
+
+    def set_document(self, doc_id: str, document: dict, writer=None):
+        """Writes now, or queues the write on writer (e.g. chart_state.ChartWriter) when one is given."""
+        if writer is not None and not self.is_local:
+            writer.set_document(self.document_ref(doc_id), document)
+            return
+        if self.is_local:
+            with self._lock:
+                self._local[doc_id] = document
+            return
+        try:
+            self.document_ref(doc_id).set(document)
+        except Exception as e:
+            print(f"Error writing {self.collection}/{doc_id}: {e}")
+
+    def set_documents(self, documents: dict[str, dict]):
+        """Writes {doc_id: document} in batch commits."""
+        if self.is_local:
+            with self._lock:
+                self._local.update(documents)
+            return
+        items = list(documents.items())
+        for i in range(0, len(items), DOCUMENT_STORE_WRITE_CHUNK):
+            batch = self._db.batch()
+            for doc_id, document in items[i:i + DOCUMENT_STORE_WRITE_CHUNK]:
+                batch.set(self.document_ref(doc_id), document)
+            try:
+                batch.commit()
+            except Exception as e:
+                print(f"Error writing {self.collection}: {e}")
+
+    def save(self):
+        """Persists the local file. Firestore documents are written as they change."""
+        if not self._path:
+            return
+        with self._lock:
+            with open(self._path, "w") as f:
+                json.dump(self._local, f)
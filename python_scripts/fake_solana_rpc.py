@@ -0,0 +1,61 @@
+# Minimal local stand-in for a Solana JSON-RPC node, for exercising main.py offline.
+# tests/test_solana_rpc.py runs it in-process to check endpoint failover.
+# Usage:
+#   python fake_solana_rpc.py 8899
+#   SOLANA_RPC_URLS=http://127.0.0.1:8899 SECRETS_BACKEND=local functions-framework --target api_router
+
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_BALANCE_LAMPORTS = 1_500_000_000
+# base58 encoding of a 64-byte all-zero signature.
+FAKE_SIGNATURE = "1" * 64
+
+
+def _result(method: str, params: list):
+    context = {"slot": 1}
+    if method == "getHealth":
+        return "ok"
+    if method == "getBalance":
+        return {"context": context, "value": FAKE_BALANCE_LAMPORTS}
+    if method == "sendTransaction":
+        return FAKE_SIGNATURE
+    if method == "getSignatureStatuses":
+        signatures = params[0] if params else []
+        return {
+            "context": context,
+            "value": [
+                {"slot": 1, "confirmations": None, "err": None, "status": {"Ok": None}, "confirmationStatus": "finalized"}
+                for _ in signatures
+            ],
+        }
+    if method == "getLatestBlockhash":
+        return {"context": context, "value": {"blockhash": "1" * 32, "lastValidBlockHeight": 100}}
+    return None
+
+
+class FakeRpcHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        calls = body if isinstance(body, list) else [body]
+        responses = [
+            {"jsonrpc": "2.0", "id": req.get("id"), "result": _result(req.get("method"), req.get("params", []))}
+            for req in calls
+        ]
+        payload = json.dumps(responses if isinstance(body, list) else responses[0]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        print(f"fake_solana_rpc: {format % args}")
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8899
+    print(f"Fake Solana RPC listening on http://127.0.0.1:{port}")
+    ThreadingHTTPServer(("127.0.0.1", port), FakeRpcHandler).serve_forever()
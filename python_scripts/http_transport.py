@@ -0,0 +1,155 @@
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# --- Configuration ---
+# All values can be overridden per deployment through environment variables.
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "15"))
+HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_BASE = float(os.environ.get("HTTP_BACKOFF_BASE", "0.25"))
+HTTP_BACKOFF_MAX = float(os.environ.get("HTTP_BACKOFF_MAX", "4"))
+# Keep-alive connections held open per upstream host.
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "10"))
+# Maximum in-flight requests per upstream host, and how long a caller waits for a slot.
+HTTP_MAX_CONCURRENCY_PER_HOST = int(os.environ.get("HTTP_MAX_CONCURRENCY_PER_HOST", "8"))
+HTTP_QUEUE_TIMEOUT = float(os.environ.get("HTTP_QUEUE_TIMEOUT", "10"))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class _HostPool:
+    """A keep-alive session and a concurrency cap for one upstream host."""
+
+    def __init__(self):
+        self.session = requests.Session()
+        # Retries are handled in request() so they can use jittered backoff.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.slots = threading.BoundedSemaphore(HTTP_MAX_CONCURRENCY_PER_HOST)
+
+
+# Pools live at module level so they survive across warm invocations of the function.
+_pools: Dict[str, _HostPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(url: str) -> _HostPool:
+    host = urlsplit(url).netloc
+    pool = _pools.get(host)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(host)
+            if pool is None:
+                pool = _HostPool()
+                _pools[host] = pool
+    return pool
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff: a random delay in [0, min(max, base * 2^attempt)]."""
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+
+def is_transient_error(error: Exception) -> bool:
+    """True for errors worth retrying: connection errors, timeouts and 429/5xx responses."""
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status in RETRY_STATUS_CODES or status >= 500
+    return False
+
+
+def moralis_error_status(error: Exception) -> Optional[int]:
+    """HTTP status of a Moralis SDK error (ApiException.status), or None if no response came back."""
+    status = getattr(error, 'status', None)
+    return status if isinstance(status, int) else None
+
+
+def is_transient_moralis_error(error: Exception) -> bool:
+    """
+    The Moralis SDK counterpart of is_transient_error: no response at all (connection
+    errors, timeouts), 429 or 5xx. Parameter validation (ValueError / TypeError) and
+    other 4xx are permanent.
+    """
+    status = moralis_error_status(error)
+    if status is None:
+        return not isinstance(error, (ValueError, TypeError))
+    return status in RETRY_STATUS_CODES or status >= 500
+
+
+def _retry_after_seconds(response: requests.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if value and value.isdigit():
+        return min(float(value), HTTP_BACKOFF_MAX)
+    return None
+
+
+def request(method: str, url: str, timeout=None, max_retries: Optional[int] = None,
+            retry_non_idempotent: bool = False, metric_name: Optional[str] = None, **kwargs) -> requests.Response:
+    """
+    Sends a request through the shared pool for the URL's host.
+    Connection errors, timeouts and 429/5xx responses are retried with jittered
+    backoff (only for idempotent methods unless retry_non_idempotent is set).
+    Returns the final response; callers still call raise_for_status() themselves.
+    The total time, retries included, is recorded under metric_name (default: the
+    upstream's name from metrics.UPSTREAM_HOSTS).
+    """
+    with metrics.timed_upstream(metric_name or metrics.upstream_name_for_host(urlsplit(url).netloc)):
+        return _request_with_retries(method, url, timeout, max_retries, retry_non_idempotent, **kwargs)
+
+
+def _request_with_retries(method: str, url: str, timeout, max_retries: Optional[int],
+                          retry_non_idempotent: bool, **kwargs) -> requests.Response:
+    method = method.upper()
+    pool = _get_pool(url)
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    if max_retries is None:
+        max_retries = HTTP_MAX_RETRIES
+    if method not in IDEMPOTENT_METHODS and not retry_non_idempotent:
+        max_retries = 0
+
+    attempt = 0
+    while True:
+        if not pool.slots.acquire(timeout=HTTP_QUEUE_TIMEOUT):
+            raise requests.exceptions.ConnectionError(
+                f"Timed out waiting for a connection slot to {urlsplit(url).netloc}")
+        try:
+            response = pool.session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt)
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+                return response
+            delay = _retry_after_seconds(response)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            response.close()
+        finally:
+            pool.slots.release()
+
+        attempt += 1
+        print(f"Retrying {method} {urlsplit(url).netloc}{urlsplit(url).path} (attempt {attempt}/{max_retries}) in {delay:.2f}s")
+        time.sleep(delay)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
@@ -0,0 +1,144 @@
+import datetime
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+import http_transport
+from document_store import DocumentStore
+from logo_thumbnails import LOGO_CACHE_CONTROL, make_thumbnails, thumbnails_available
+
+# --- Logo Index ---
+# Remembers, per source logo URL, what was last downloaded (ETag / Last-Modified and a
+# SHA-256 of the bytes) and where it was uploaded. Logos are stored content-addressed
+# as WebP thumbnails ({prefix}/{sha256}_{size}.webp, see logo_thumbnails.py) or, without
+# Pillow, as served ({prefix}/{sha256}.{ext}), so a logo is uploaded once no matter how
+# many tokens or runs use it. LOGO_INDEX_FILE selects the offline JSON file (see document_store.py).
+
+LOGO_INDEX_COLLECTION = 'logo_index'
+LOGO_INDEX_FILE = os.environ.get("LOGO_INDEX_FILE", "")
+# Logos downloaded / uploaded at the same time
+LOGO_WORKERS = int(os.environ.get("LOGO_WORKERS", "8"))
+
+
+class LogoIndex(DocumentStore):
+    """source URL -> {source_url, etag, last_modified, content_hash, logo_urls, checked_at}."""
+
+    def __init__(self, db=None, path: str = LOGO_INDEX_FILE):
+        super().__init__(LOGO_INDEX_COLLECTION, db, path)
+
+    @staticmethod
+    def _doc_id(source_url: str) -> str:
+        # URLs contain '/', which Firestore document IDs cannot.
+        return hashlib.sha256(source_url.encode()).hexdigest()
+
+    def get(self, source_url: str) -> dict | None:
+        return self.get_document(self._doc_id(source_url))
+
+    def put(self, source_url: str, entry: dict):
+        self.set_document(self._doc_id(source_url), entry)
+
+
+def file_extension_for(content_type: str) -> str:
+    file_extension = 'webp' # Default or derive from content_type
+    if 'image/' in content_type:
+        file_extension = content_type.split('/')[-1].replace('jpeg', 'jpg').split(';')[0]
+    return file_extension
+
+
+def upload_public(bucket, path: str, content: bytes, content_type: str) -> str:
+    blob = bucket.blob(path)
+    # Content-addressed: another token or URL may already have uploaded these bytes.
+    if not blob.exists():
+        blob.cache_control = LOGO_CACHE_CONTROL
+        blob.upload_from_string(content, content_type=content_type)
+        blob.make_public() # Make the image publicly accessible
+        print(f"Uploaded {blob.public_url}")
+    return blob.public_url
+
+
+def upload_logo(bucket, content: bytes, content_type: str, content_hash: str, prefix: str, process_pool) -> dict[str, str]:
+    """
+    Uploads WebP thumbnails (made in the process pool when there is one), or the
+    original bytes when Pillow is not installed or cannot decode the image.
+    Returns the trade's logo fields.
+    """
+    if thumbnails_available():
+        try:
+            if process_pool is not None:
+                thumbnails = process_pool.submit(make_thumbnails, content).result()
+            else:
+                thumbnails = make_thumbnails(content)
+            urls = [upload_public(bucket, f"{prefix}/{content_hash}_{size}.webp", data, 'image/webp')
+                    for size, data in sorted(thumbnails.items())]
+            return {'firebase_logo_small_url': urls[0], 'firebase_logo_url': urls[-1]}
+        except Exception as e:
+            print(f"Could not make thumbnails for {content_hash}, uploading the original: {e}")
+    # Extract content type (e.g., 'image/webp') and determine file extension
+    url = upload_public(bucket, f"{prefix}/{content_hash}.{file_extension_for(content_type)}", content, content_type)
+    return {'firebase_logo_small_url': url, 'firebase_logo_url': url}
+
+
+def sync_logo(index: LogoIndex, bucket, source_url: str, prefix: str, process_pool=None) -> dict[str, str]:
+    """
+    Returns the trade's logo fields (firebase_logo_url, firebase_logo_small_url) for one
+    source logo. The download is conditional on the stored ETag / Last-Modified;
+    unchanged or identical content is never processed or uploaded again. Raises on
+    download or upload errors.
+    """
+    entry = index.get(source_url)
+    headers = {}
+    if entry and entry.get('logo_urls'):
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    image_response = http_transport.get(source_url, headers=headers)
+    now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    if image_response.status_code == 304:
+        print(f"Logo unchanged (304) for {source_url}")
+        return entry['logo_urls']
+    image_response.raise_for_status() # Raise an exception for bad status codes
+
+    content = image_response.content
+    content_hash = hashlib.sha256(content).hexdigest()
+    if entry and entry.get('content_hash') == content_hash and entry.get('logo_urls'):
+        print(f"Logo content unchanged for {source_url}")
+        logo_urls = entry['logo_urls']
+    else:
+        content_type = image_response.headers.get('Content-Type', 'application/octet-stream')
+        logo_urls = upload_logo(bucket, content, content_type, content_hash, prefix, process_pool)
+
+    index.put(source_url, {
+        'source_url': source_url,
+        'etag': image_response.headers.get('ETag'),
+        'last_modified': image_response.headers.get('Last-Modified'),
+        'content_hash': content_hash,
+        'logo_urls': logo_urls,
+        'checked_at': now,
+    })
+    return logo_urls
+
+
+def sync_logos(index: LogoIndex, bucket, source_urls: list[str], prefix: str, process_pool=None) -> dict[str, dict[str, str]]:
+    """
+    Syncs every distinct source URL on a pool of LOGO_WORKERS threads. Thumbnail
+    encoding is handed to process_pool (see logo_thumbnails.thumbnail_pool) when one
+    is given, so it never holds up downloads and uploads; the caller owns the pool.
+    Returns {source_url: logo fields}; URLs that failed are left out.
+    """
+    uploaded_image_urls = {}
+    with ThreadPoolExecutor(max_workers=LOGO_WORKERS) as executor:
+        futures = {executor.submit(sync_logo, index, bucket, url, prefix, process_pool): url for url in set(source_urls)}
+        for future in as_completed(futures):
+            source_url = futures[future]
+            try:
+                uploaded_image_urls[source_url] = future.result()
+            except requests.exceptions.RequestException as e:
+                print(f"Error downloading image {source_url}: {e}")
+            except Exception as e:
+                print(f"Error uploading image {source_url} to Firebase Storage: {e}")
+    index.save()
+    return uploaded_image_urls
@@ -0,0 +1,62 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional
+    Image = None
+
+# --- Logo Thumbnails ---
+# Decodes a downloaded logo and re-encodes it as small WebP thumbnails. The token grid
+# in lib/main.dart draws logos at 25px and the details sheet at 120px, so 64px and
+# 256px cover both at 2-3x device pixel ratios. Runs in worker processes (see
+# logo_index.sync_logos) because decoding and resizing is CPU-bound. Pillow is
+# optional: without it logos are uploaded as served.
+
+# Thumbnail edge lengths, smallest first; each is stored as {prefix}/{sha256}_{size}.webp
+LOGO_THUMBNAIL_SIZES = tuple(int(size) for size in os.environ.get("LOGO_THUMBNAIL_SIZES", "64,256").split(","))
+LOGO_WEBP_QUALITY = int(os.environ.get("LOGO_WEBP_QUALITY", "85"))
+LOGO_PROCESS_WORKERS = int(os.environ.get("LOGO_PROCESS_WORKERS", str(os.cpu_count() or 1)))
+# Thumbnails are content-addressed, so they can be cached forever.
+LOGO_CACHE_CONTROL = os.environ.get("LOGO_CACHE_CONTROL", "public, max-age=31536000, immutable")
+
+
+def thumbnails_available() -> bool:
+    return Image is not None
+
+
+def thumbnail_pool() -> ProcessPoolExecutor | None:
+    """
+    Worker processes for make_thumbnails, or None to encode in the calling thread.
+    Workers are started with forkserver (spawn where it is missing), never fork,
+    so they do not inherit locks held by other threads or the parent's gRPC
+    channels. Both start methods import the calling script, so it must run its
+    pipeline under an `if __name__ == "__main__":` guard.
+    """
+    if Image is None:
+        return None
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=LOGO_PROCESS_WORKERS, mp_context=multiprocessing.get_context(start_method))
+
+
+def make_thumbnails(content: bytes) -> dict[int, bytes]:
+    """
+    {size: webp_bytes} for every LOGO_THUMBNAIL_SIZES entry. The logo keeps its aspect
+    ratio within a size x size box and is never upscaled. Raises if the bytes are not
+    an image Pillow can decode.
+    """
+    resample = getattr(Image, 'Resampling', Image).LANCZOS
+    with Image.open(io.BytesIO(content)) as source:
+        source.seek(0) # First frame of animated logos
+        image = source.convert('RGBA')
+
+    thumbnails = {}
+    for size in LOGO_THUMBNAIL_SIZES:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size), resample)
+        output = io.BytesIO()
+        thumbnail.save(output, format='WEBP', quality=LOGO_WEBP_QUALITY, method=6)
+        thumbnails[size] = output.getvalue()
+    return thumbnails
@@ -1,15 +1,24 @@
 import functions_framework
 import requests
 import json
-from typing import Optional, Dict, Any
-import decimal
-from solana.rpc.api import Client
+import http_transport
+import metrics
+import os
+from ttl_cache import TTLCache
+from typing import Optional, Dict, Any, List
+from concurrent.futures import Future, ThreadPoolExecutor
+import math
+import time
+from solana_rpc import SolanaRpcManager
 from solders.pubkey import Pubkey
+from solders.signature import Signature
 from solders.transaction import Transaction
 from solders.transaction_status import VersionedTransaction
 #from spl.token.instructions import get_associated_token_address
 import base64
-from google.cloud import secretmanager
+from moralis_prices import MORALIS_PRICE_BATCH_SIZE, fetch_usd_prices_chunk
+from token_amounts import to_base_units
+from secret_store import get_cached_secret, peek_cached_secret, warm_secrets
 
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*', # Allows all origins for development
@@ -18,22 +27,89 @@ CORS_HEADERS = {
     'Access-Control-Max-Age': '3600' # Cache preflight response for 1 hour
 }
 
+# Add project id's to this as needed
+PROJECT_IDS = {
+    "meme_hunter": "194957573763",
+}
+
+# Secrets used by the api_router helpers. They are prefetched when the instance
+# starts so the first request does not pay the Secret Manager round-trip.
+ROUTER_SECRETS = [
+    "MORALIS_API_KEY",
+    "HELIUS_API_KEY",
+    "0X_API_KEY",
+    "0x_FEE_RECIPIENT_ADDRESS",
+    "JUPITER_FEE_RECIPIENT_ADDRESS",
+]
+
+# Shared pool used to run independent upstream calls of one request concurrently
+# (secret fetches next to quotes, batch price chunks). Instances serve several
+# requests at once, so everything it runs must be thread-safe.
+UPSTREAM_CONCURRENCY = int(os.environ.get("UPSTREAM_CONCURRENCY", "8"))
+upstream_executor = ThreadPoolExecutor(max_workers=UPSTREAM_CONCURRENCY, thread_name_prefix="upstream")
+# Secret Manager reads that miss the cache get their own small pool, so a slow
+# fetch never takes a slot from quote and price calls.
+SECRET_FETCH_CONCURRENCY = int(os.environ.get("SECRET_FETCH_CONCURRENCY", "2"))
+secret_executor = ThreadPoolExecutor(max_workers=SECRET_FETCH_CONCURRENCY, thread_name_prefix="secret")
+
 # --- Helper function to get secrets from Google Cloud Secret Manager ---
+# Values come from the process-wide cache in secret_store.py, which shares one
+# Secret Manager client and refreshes entries in the background before they expire.
 def get_secret(project_id: str, secret_id: str):
 
-    # Add project id's to this as needed
-    if(project_id == "meme_hunter"):
-        project_id = "194957573763"
+    project_id = PROJECT_IDS.get(project_id, project_id)
     try:
-        client = secretmanager.SecretManagerServiceClient()
-        name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
-        response = client.access_secret_version(request={"name": name})
-        return response.payload.data.decode("UTF-8")
+        return get_cached_secret(project_id, secret_id)
     except Exception as e:
         print(f"Error accessing secret: {e}")
         return None
 
+def get_secret_async(project_id: str, secret_id: str):
+    """
+    Returns a Future for get_secret. Cached values come back as an already completed
+    Future; only a real cache miss is fetched on the secret pool.
+    """
+    value = peek_cached_secret(PROJECT_IDS.get(project_id, project_id), secret_id)
+    if value is not None:
+        future = Future()
+        future.set_result(value)
+        return future
+    return metrics.run_in_context(secret_executor, get_secret, project_id, secret_id)
+
+warm_secrets(PROJECT_IDS["meme_hunter"], ROUTER_SECRETS)
+
+# Process-wide Solana RPC clients (Helius by default, see SOLANA_RPC_URLS), built on
+# first use and reused across requests instead of creating a Client per call.
+solana_rpc = SolanaRpcManager(lambda secret_id: get_secret("meme_hunter", secret_id))
+
+# --- Token price cache ---
+# The client polls the same handful of trending tokens, so prices are kept for a few
+# seconds and served stale for a little longer while one background call refreshes them.
+PRICE_CACHE_TTL_SECONDS = float(os.environ.get("PRICE_CACHE_TTL_SECONDS", "5"))
+PRICE_CACHE_STALE_SECONDS = float(os.environ.get("PRICE_CACHE_STALE_SECONDS", "30"))
+PRICE_CACHE_MAX_ENTRIES = int(os.environ.get("PRICE_CACHE_MAX_ENTRIES", "2048"))
+
+price_cache = TTLCache(
+    maxsize=PRICE_CACHE_MAX_ENTRIES,
+    ttl=PRICE_CACHE_TTL_SECONDS,
+    stale_ttl=PRICE_CACHE_STALE_SECONDS,
+    # Only cache real prices, never errors or missing values.
+    should_cache=lambda value: isinstance(value, float),
+    name="price",
+)
+
+def price_cache_key(contract_address: str, chain: str):
+    # EVM addresses are case-insensitive, Solana mints are not.
+    return (chain, contract_address.lower() if chain == "eth" else contract_address)
+
 def get_token_price_Moralis(contract_address: str, chain: str):
+    # Concurrent requests for the same token share one upstream call.
+    return price_cache.get_or_load(
+        price_cache_key(contract_address, chain),
+        lambda: fetch_token_price_Moralis(contract_address, chain)
+    )
+
+def fetch_token_price_Moralis(contract_address: str, chain: str):
 
     if(chain == "eth"):
         url = f"https://deep-index.moralis.io/api/v2.2/erc20/{contract_address}/price"
@@ -57,7 +133,7 @@ def get_token_price_Moralis(contract_address: str, chain: str):
     }
 
     try:
-        response = requests.get(url, headers=headers, params=params)
+        response = http_transport.get(url, headers=headers, params=params)
         response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
         data = response.json()
         usd_price = data.get('usdPrice')
@@ -69,22 +145,66 @@ def get_token_price_Moralis(contract_address: str, chain: str):
         print(f"Error decoding JSON response: {e}")
         return None
 
-def get_balance_Solflare(wallet_address: str, contract_address: str = None):
+# --- Batch token prices ---
+# Upper bound on addresses accepted by one get_token_prices call.
+MAX_BATCH_PRICE_ADDRESSES = 500
+
+def fetch_token_prices_chunk_Moralis(contract_addresses: List[str], chain: str, api_key: str) -> Dict[str, float]:
     try:
-        # Get the API key from Secret Manager
-        api_key = get_secret("meme_hunter", "HELIUS_API_KEY")
+        prices = fetch_usd_prices_chunk(chain, contract_addresses, api_key)
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching token prices for batch starting with {contract_addresses[0]}: {e}")
+        return {}
+    except (TypeError, ValueError) as e:
+        print(f"Error decoding batch price response: {e}")
+        return {}
+    return {price_cache_key(address, chain)[1]: price for address, price in prices.items()}
+
+def get_token_prices_Moralis(contract_addresses: List[str], chain: str):
+    """
+    Prices many tokens in one router call. Cached prices are used where fresh, the
+    rest are fetched from the Moralis multi-token endpoint in concurrent chunks.
+    Returns {contract_address: usd_price or None}.
+    """
+    results = {}
+    missing = []
+    for address in contract_addresses:
+        cached = price_cache.get(price_cache_key(address, chain))
+        if cached is not None:
+            results[address] = cached
+        elif address not in missing:
+            missing.append(address)
+
+    if not missing:
+        return results
 
-        if not api_key:
-            print("Failed to retrieve API key from Secret Manager. Exiting.")
-            return {"error": "Failed to retrieve API key from Secret Manager. Exiting."}
+    api_key = get_secret("meme_hunter", "MORALIS_API_KEY")
 
-        RPC_URL = f"https://mainnet.helius-rpc.com/?api-key={api_key}"
-        client = Client(RPC_URL)
+    if not api_key:
+        print("Failed to retrieve API key from Secret Manager. Exiting.")
+        return {"error": "Failed to retrieve API key from Secret Manager. Exiting."}
+
+    batch_size = MORALIS_PRICE_BATCH_SIZE[chain]
+    chunks = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+    fetched = {}
+    futures = [metrics.run_in_context(upstream_executor, fetch_token_prices_chunk_Moralis, chunk, chain, api_key) for chunk in chunks]
+    for future in futures:
+        fetched.update(future.result())
+
+    for address in missing:
+        key = price_cache_key(address, chain)
+        price = fetched.get(key[1])
+        price_cache.put(key, price)
+        results[address] = price
+
+    return results
+
+def get_balance_Solflare(wallet_address: str, contract_address: str = None):
+    try:
         wallet_pubkey = Pubkey.from_string(wallet_address)
-        print('got here')
         if not contract_address:
             # Case 1: Fetch native SOL balance
-            balance_in_lamports = client.get_balance(wallet_pubkey).value
+            balance_in_lamports = solana_rpc.call(lambda client: client.get_balance(wallet_pubkey)).value
             return balance_in_lamports / 10**9  # 1 SOL = 10^9 Lamports
         #else:
             # Commenting out spl, it is not used yet for this app, it only checks SOL
@@ -103,95 +223,148 @@ def get_balance_Solflare(wallet_address: str, contract_address: str = None):
         print(f"Error fetching balance: {e}")
         return None
 
-def get_0x_swap_quote(token_contract_address, weth_amount_to_spend, taker_address):
-
-    decimal.getcontext().prec = 50
-
-    API_BASE_URL = "https://api.0x.org"
-    WETH_CONTRACT_ADDRESS = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
-    # The affiliate fee in basis points (BPS). 1 BPS = 0.01%.
-    # 0.25% = 25 BPS.
-    AFFILIATE_FEE_BPS = 25
-
-    # Define the API endpoint for getting a quote.
-    endpoint = f"{API_BASE_URL}/swap/allowance-holder/quote"
-
-    try:
-        # Get the API key from Secret Manager
-        api_key = get_secret("meme_hunter", "0X_API_KEY")
-
-        if not api_key:
-            print("Failed to retrieve API key from Secret Manager. Exiting.")
-            return {"error": "Failed to retrieve API key from Secret Manager. Exiting."}
-
-        # Get the API key from Secret Manager
-        fee_recipient_address = get_secret("meme_hunter", "0x_FEE_RECIPIENT_ADDRESS")
-
-        if not fee_recipient_address:
-            print("Failed to retrieve fee receipient address from Secret Manager. Exiting.")
-            return {"error": "Failed to retrieve fee receipient address from Secret Manager. Exiting."}
-
-        # Convert the human-readable WETH amount to the smallest unit (wei)
-        # as required by the 0x API. 1 ETH = 10^18 wei.
-        wei_amount_to_spend = int(decimal.Decimal(str(weth_amount_to_spend)) * decimal.Decimal('1e18'))
-
-        # Define the query parameters for the API request.
+ZEROX_API_BASE_URL = "https://api.0x.org"
+# Define the API endpoint for getting a quote.
+ZEROX_QUOTE_ENDPOINT = f"{ZEROX_API_BASE_URL}/swap/allowance-holder/quote"
+WETH_CONTRACT_ADDRESS = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+WETH_DECIMALS = 18
+# The affiliate fee in basis points (BPS). 1 BPS = 0.01%.
+# 0.25% = 25 BPS.
+AFFILIATE_FEE_BPS = 25
+# Upper bound on sell amounts accepted by one quote ladder call.
+MAX_QUOTE_LADDER_STEPS = 10
+
+class ZeroExQuoteBuilder:
+    """
+    Holds the parts of a 0x quote request that never change for a given API key and
+    fee recipient, so each quote only fills in the buy token, amount and taker.
+    """
+
+    def __init__(self, api_key: str, fee_recipient_address: str):
+        self.secrets = (api_key, fee_recipient_address)
+        # Set up the headers, including the API key for authentication.
+        self.headers = {
+            "0x-api-key": api_key,
+            "0x-version": "v2",
+            "Accept": "application/json"
+        }
         # sellToken and buyToken are contract addresses.
-        # sellAmount is the amount of the sellToken in its smallest denomination (wei).
-        # affiliateAddress and affiliateFeeBps are for collecting fees.
-        params = {
+        # swapFeeRecipient and swapFeeBps are for collecting fees.
+        self.base_params = {
             "chainId": 1,
             "sellToken": WETH_CONTRACT_ADDRESS,
-            "buyToken": token_contract_address,
-            "sellAmount": str(wei_amount_to_spend),
             "swapFeeRecipient": fee_recipient_address,
             "swapFeeBps": AFFILIATE_FEE_BPS,
             "swapFeeToken": WETH_CONTRACT_ADDRESS,
-            "taker": taker_address,
         }
 
-        # Set up the headers, including the API key for authentication.
-        headers = {
-            "0x-api-key": api_key,
-            "0x-version": "v2",
-            "Accept": "application/json"
-        }
+    def fetch_quote(self, token_contract_address: str, weth_amount_to_spend, taker_address: str):
+        try:
+            # sellAmount is the amount of the sellToken in its smallest denomination (wei).
+            params = dict(self.base_params)
+            params["buyToken"] = token_contract_address
+            params["sellAmount"] = str(to_base_units(weth_amount_to_spend, WETH_DECIMALS))
+            params["taker"] = taker_address
 
-        # Make the GET request to the API.
-        response = requests.get(endpoint, params=params, headers=headers)
+            response = http_transport.get(ZEROX_QUOTE_ENDPOINT, params=params, headers=self.headers)
 
-        # Raise an exception for bad status codes (4xx or 5xx).
-        response.raise_for_status()
+            # Raise an exception for bad status codes (4xx or 5xx).
+            response.raise_for_status()
 
-        # Parse the JSON response.
-        quote_data = response.json()
-        return quote_data
+            # Parse the JSON response.
+            return response.json()
 
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred during the API request: {e}")
-        return {"error": str(e)}
-    except (ValueError, TypeError) as e:
-        print(f"Invalid input: {e}")
-        return {"error": f"Invalid input: {e}"}
+        except requests.exceptions.RequestException as e:
+            print(f"An error occurred during the API request: {e}")
+            return {"error": str(e)}
+        except (ValueError, TypeError) as e:
+            print(f"Invalid input: {e}")
+            return {"error": f"Invalid input: {e}"}
 
-def generate_jupiter_swap_tx(output_token_mint: str, lamport_amount_to_sell: int, user_wallet_address: str):
-    JUPITER_API_BASE_URL = "https://lite-api.jup.ag/swap/v1"
-    SOL_MINT_ADDRESS = "So11111111111111111111111111111111111111112"
-    # 0.25% in Basis Points (1 bp = 0.01%)
-    FEE_BPS = 25
-    # Standard SOL decimals
-    SOL_DECIMALS = 9
+_zero_ex_builder: Optional[ZeroExQuoteBuilder] = None
+
+def get_zero_ex_quote_builder():
+    """Returns the instance's quote builder, rebuilding it only if a secret has rotated."""
+    global _zero_ex_builder
+
+    # Get the API key and fee recipient from Secret Manager at the same time
+    api_key_future = get_secret_async("meme_hunter", "0X_API_KEY")
+    fee_recipient_future = get_secret_async("meme_hunter", "0x_FEE_RECIPIENT_ADDRESS")
+    api_key = api_key_future.result()
+    fee_recipient_address = fee_recipient_future.result()
 
+    if not api_key:
+        print("Failed to retrieve API key from Secret Manager. Exiting.")
+        return {"error": "Failed to retrieve API key from Secret Manager. Exiting."}
+
+    if not fee_recipient_address:
+        print("Failed to retrieve fee receipient address from Secret Manager. Exiting.")
+        return {"error": "Failed to retrieve fee receipient address from Secret Manager. Exiting."}
+
+    builder = _zero_ex_builder
+    if builder is None or builder.secrets != (api_key, fee_recipient_address):
+        builder = ZeroExQuoteBuilder(api_key, fee_recipient_address)
+        _zero_ex_builder = builder
+    return builder
+
+def get_0x_swap_quote(token_contract_address, weth_amount_to_spend, taker_address):
+    builder = get_zero_ex_quote_builder()
+    if isinstance(builder, dict):
+        return builder
+    return builder.fetch_quote(token_contract_address, weth_amount_to_spend, taker_address)
+
+def get_0x_swap_quote_ladder(token_contract_address, weth_amounts: List[str], taker_address):
+    """Quotes several sell amounts for the same token concurrently, in request order."""
+    builder = get_zero_ex_quote_builder()
+    if isinstance(builder, dict):
+        return builder
+    futures = [
+        metrics.run_in_context(upstream_executor, builder.fetch_quote, token_contract_address, amount, taker_address)
+        for amount in weth_amounts
+    ]
+    return [{"weth_amount_to_spend": amount, "quote": future.result()} for amount, future in zip(weth_amounts, futures)]
+
+JUPITER_API_BASE_URL = "https://lite-api.jup.ag/swap/v1"
+SOL_MINT_ADDRESS = "So11111111111111111111111111111111111111112"
+# 0.25% in Basis Points (1 bp = 0.01%)
+JUPITER_FEE_BPS = 25
+
+# --- Jupiter quote cache ---
+# Quote previews for nearby amounts share a cache entry: amounts are bucketed on a
+# log scale, so each bucket spans JUPITER_QUOTE_BUCKET_BPS of relative size.
+JUPITER_QUOTE_BUCKET_BPS = float(os.environ.get("JUPITER_QUOTE_BUCKET_BPS", "50"))
+# A cached quote is only reused if its inAmount is within this drift of the request.
+JUPITER_QUOTE_MAX_DRIFT_BPS = float(os.environ.get("JUPITER_QUOTE_MAX_DRIFT_BPS", "100"))
+# Base freshness for a quote at JUPITER_QUOTE_REFERENCE_SLIPPAGE_BPS. Quotes with
+# tighter slippage go stale sooner, looser ones last longer, within the min/max.
+JUPITER_QUOTE_TTL_SECONDS = float(os.environ.get("JUPITER_QUOTE_TTL_SECONDS", "2"))
+JUPITER_QUOTE_MIN_TTL_SECONDS = float(os.environ.get("JUPITER_QUOTE_MIN_TTL_SECONDS", "0.5"))
+JUPITER_QUOTE_MAX_TTL_SECONDS = float(os.environ.get("JUPITER_QUOTE_MAX_TTL_SECONDS", "5"))
+JUPITER_QUOTE_REFERENCE_SLIPPAGE_BPS = 50
+
+jupiter_quote_cache = TTLCache(maxsize=1024, ttl=JUPITER_QUOTE_MAX_TTL_SECONDS, name="jupiter_quote")
+
+def quote_amount_bucket(lamport_amount: int) -> int:
+    if lamport_amount <= 0:
+        return 0
+    return int(math.log(lamport_amount) / math.log1p(JUPITER_QUOTE_BUCKET_BPS / 10000))
+
+def jupiter_quote_ttl(quote_response: dict) -> float:
+    slippage_bps = quote_response.get("slippageBps") or JUPITER_QUOTE_REFERENCE_SLIPPAGE_BPS
+    ttl = JUPITER_QUOTE_TTL_SECONDS * slippage_bps / JUPITER_QUOTE_REFERENCE_SLIPPAGE_BPS
+    return min(max(ttl, JUPITER_QUOTE_MIN_TTL_SECONDS), JUPITER_QUOTE_MAX_TTL_SECONDS)
+
+def fetch_jupiter_quote(output_token_mint: str, lamport_amount_to_sell: int):
     quote_url = f"{JUPITER_API_BASE_URL}/quote"
     quote_params = {
         "inputMint": SOL_MINT_ADDRESS,
         "outputMint": output_token_mint,
         "amount": lamport_amount_to_sell,
-        "platformFeeBps": FEE_BPS,
+        "platformFeeBps": JUPITER_FEE_BPS,
     }
 
     try:
-        response = requests.get(quote_url, params=quote_params)
+        response = http_transport.get(quote_url, params=quote_params, metric_name="jupiter_quote")
         response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
         quote_response = response.json()
     except requests.exceptions.RequestException as e:
@@ -202,11 +375,45 @@ def generate_jupiter_swap_tx(output_token_mint: str, lamport_amount_to_sell: int
     if not quote_response.get("outAmount"):
         print("Quote response did not return a valid route or outAmount.")
         # print(json.dumps(quote_response, indent=2))
-        return {"error": f"Quote response did not return a valid route or outAmount. {e}"}
+        return {"error": "Quote response did not return a valid route or outAmount."}
+
+    return quote_response
+
+def get_jupiter_quote(output_token_mint: str, lamport_amount_to_sell: int):
+    """
+    Quote preview for the swap screen. Served from the quote cache when a recent
+    quote for the same mint and amount bucket is within the drift and slippage-aware
+    freshness limits. The returned estimatedOutAmount is scaled to the requested amount.
+    Never used to build a transaction: generate_jupiter_swap_tx always fetches fresh.
+    """
+    key = (output_token_mint, quote_amount_bucket(lamport_amount_to_sell))
+    cached = jupiter_quote_cache.get(key)
+    if cached is not None:
+        quote_response, fetched_at = cached
+        in_amount = int(quote_response.get("inAmount", 0))
+        drift_bps = abs(in_amount - lamport_amount_to_sell) * 10000 / lamport_amount_to_sell
+        if drift_bps <= JUPITER_QUOTE_MAX_DRIFT_BPS and time.monotonic() - fetched_at < jupiter_quote_ttl(quote_response):
+            metrics.increment("jupiter_quote_cache_served")
+            estimated_out = int(quote_response["outAmount"]) * lamport_amount_to_sell // in_amount
+            return {"quote": quote_response, "estimatedOutAmount": str(estimated_out), "cached": True}
+
+    quote_response = fetch_jupiter_quote(output_token_mint, lamport_amount_to_sell)
+    if "error" in quote_response:
+        return quote_response
+    jupiter_quote_cache.put(key, (quote_response, time.monotonic()))
+    return {"quote": quote_response, "estimatedOutAmount": quote_response["outAmount"], "cached": False}
+
+def generate_jupiter_swap_tx(output_token_mint: str, lamport_amount_to_sell: int, user_wallet_address: str):
+    # Get fee account address from Secret Manager while the quote is in flight
+    fee_recipient_future = get_secret_async("meme_hunter", "JUPITER_FEE_RECIPIENT_ADDRESS")
+
+    # The executed route must be current, so the quote cache is bypassed here.
+    quote_response = fetch_jupiter_quote(output_token_mint, lamport_amount_to_sell)
+    if "error" in quote_response:
+        return quote_response
 
     swap_url = f"{JUPITER_API_BASE_URL}/swap"
-    # Get fee account address from Secret Manager
-    fee_recipient_address = get_secret("meme_hunter", "JUPITER_FEE_RECIPIENT_ADDRESS")
+    fee_recipient_address = fee_recipient_future.result()
 
     if not fee_recipient_address:
         print("Failed to retrieve fee receipient address from Secret Manager. Exiting.")
@@ -219,10 +426,13 @@ def generate_jupiter_swap_tx(output_token_mint: str, lamport_amount_to_sell: int
     }
 
     try:
-        response = requests.post(
+        # Building the swap transaction has no side effects, so it is safe to retry.
+        response = http_transport.post(
             swap_url,
             headers={"Content-Type": "application/json"},
-            data=json.dumps(swap_body)
+            data=json.dumps(swap_body),
+            retry_non_idempotent=True,
+            metric_name="jupiter_swap"
         )
         response.raise_for_status()
         swap_transaction = response.json()
@@ -232,7 +442,7 @@ def generate_jupiter_swap_tx(output_token_mint: str, lamport_amount_to_sell: int
 
     return swap_transaction
 
-def send_transaction_Solana(signed_transaction_base64: str):
+def send_transaction_Solana(signed_transaction_base64: str, wait_for_confirmation: bool = True):
     try:
         tx_bytes = base64.b64decode(signed_transaction_base64)
         try:
@@ -240,31 +450,68 @@ def send_transaction_Solana(signed_transaction_base64: str):
         except Exception:
             signed_transaction = Transaction.from_bytes(tx_bytes)
 
-        # Get the API key from Secret Manager
-        api_key = get_secret("meme_hunter", "HELIUS_API_KEY")
-
-        if not api_key:
-            print("Failed to retrieve API key from Secret Manager. Exiting.")
-            return {"error": "Failed to retrieve API key from Secret Manager. Exiting."}
-
-        RPC_URL = f"https://mainnet.helius-rpc.com/?api-key={api_key}"
-        client = Client(RPC_URL)
+        # Resubmitting the same signed transaction to another endpoint is safe: the
+        # cluster deduplicates it by signature.
+        response = solana_rpc.call(lambda client: client.send_transaction(signed_transaction))
 
-        response = client.send_transaction(signed_transaction)
+        signature = response.value
 
-        signature = str(response.value)
+        if not wait_for_confirmation:
+            # Submit-and-return: the client polls get_transaction_status instead of
+            # holding this instance open for the whole confirmation window.
+            return str(signature)
 
-        confirmation_response = client.confirm_transaction(signature)
+        confirmation_response = solana_rpc.call(lambda client: client.confirm_transaction(signature))
 
         if confirmation_response.value.is_err():
             print(f"Transaction confirmation failed or timed out: {confirmation_response.value.err}")
             return {"error": f"Transaction confirmation failed or timed out: {confirmation_response.value.err}"}
 
-        return signature
+        return str(signature)
     except Exception as e:
         print(f"Error sending Solana transaction: {e}")
         return {"error": f"Error sending Solana transaction: {e}"}
 
+# getSignatureStatuses accepts at most this many signatures per call.
+MAX_SIGNATURES_PER_STATUS_CALL = 256
+# Upper bound on signatures accepted by one get_transaction_status call (one RPC call).
+MAX_TRANSACTION_STATUS_SIGNATURES = MAX_SIGNATURES_PER_STATUS_CALL
+
+def get_transaction_status_Solana(signatures: List[str]):
+    """
+    Looks up the confirmation status of many signatures with getSignatureStatuses.
+    Returns {signature: {"confirmation_status", "err", "slot"}}, or None for
+    signatures the cluster has not seen (yet).
+    """
+    try:
+        parsed = [Signature.from_string(signature) for signature in signatures]
+    except ValueError as e:
+        return {"error": f"Invalid signature: {e}"}
+
+    statuses = {}
+    try:
+        for i in range(0, len(parsed), MAX_SIGNATURES_PER_STATUS_CALL):
+            chunk = parsed[i:i + MAX_SIGNATURES_PER_STATUS_CALL]
+            response = solana_rpc.call(lambda client: client.get_signature_statuses(chunk))
+            for signature, status in zip(chunk, response.value):
+                if status is None:
+                    statuses[str(signature)] = None
+                    continue
+                confirmation_status = status.confirmation_status
+                statuses[str(signature)] = {
+                    # e.g. TransactionConfirmationStatus.Finalized -> "finalized"
+                    "confirmation_status": str(confirmation_status).split(".")[-1].lower() if confirmation_status is not None else None,
+                    "err": str(status.err) if status.err is not None else None,
+                    "slot": status.slot,
+                }
+        return statuses
+    except Exception as e:
+        print(f"Error fetching Solana transaction statuses: {e}")
+        return {"error": f"Error fetching Solana transaction statuses: {e}"}
+
+# Opt-in debugging route that dumps the latency histograms and cache counters.
+ENABLE_METRICS_ROUTE = os.environ.get("ENABLE_METRICS_ROUTE", "false").lower() == "true"
+
 # --- The main entry point for a single deployed function ---
 @functions_framework.http
 def api_router(request):
@@ -291,6 +538,23 @@ def api_router(request):
     if not function_name:
         return ("Missing function parameter", 400, CORS_HEADERS)
 
+    if function_name == "metrics" and ENABLE_METRICS_ROUTE:
+        return (metrics.snapshot(), 200, CORS_HEADERS)
+
+    with metrics.request_scope(function_name) as scope:
+        body, status, headers = route_request(function_name, request_args)
+        if status == 400:
+            # Validation failures (and unknown function names) share one histogram.
+            scope.route = "bad_request"
+
+    # Per-upstream timings for the browser's devtools and Resource Timing API.
+    headers = dict(headers)
+    headers["Server-Timing"] = scope.server_timing()
+    headers["Access-Control-Expose-Headers"] = "Server-Timing"
+    headers["Timing-Allow-Origin"] = "*"
+    return (body, status, headers)
+
+def route_request(function_name: str, request_args):
     if function_name == "get_token_price_Moralis":
         contract = request_args.get("contract_address")
         chain = request_args.get("chain")
@@ -301,6 +565,22 @@ def api_router(request):
         result = get_token_price_Moralis(contract, chain)
         return ({"token_price": result}, 200, CORS_HEADERS) if result is not None else ("Error fetching token price", 500, CORS_HEADERS)
 
+    elif function_name == "get_token_prices":
+        addresses = request_args.get("contract_addresses")
+        chain = request_args.get("chain")
+        if not addresses:
+            return ("Missing contract_addresses parameter", 400, CORS_HEADERS)
+        if chain not in MORALIS_PRICE_BATCH_SIZE:
+            return ("Missing or unsupported chain parameter", 400, CORS_HEADERS)
+        # GET requests send a comma-separated string, JSON bodies may send a list.
+        if isinstance(addresses, str):
+            addresses = addresses.split(",")
+        addresses = [address.strip() for address in addresses if address and address.strip()]
+        if len(addresses) > MAX_BATCH_PRICE_ADDRESSES:
+            return (f"Too many contract_addresses (max {MAX_BATCH_PRICE_ADDRESSES})", 400, CORS_HEADERS)
+        result = get_token_prices_Moralis(addresses, chain)
+        return ({"token_prices": result}, 200, CORS_HEADERS)
+
     elif function_name == "get_balance_Solflare":
         print('in api_router, function = get_balance_Solflare')
         wallet = request_args.get("wallet_address")
@@ -324,6 +604,24 @@ def api_router(request):
         result = get_0x_swap_quote(token, weth_amount, taker)
         return ({"quote": result}, 200, CORS_HEADERS) if result is not None else ("Error fetching 0x quote", 500, CORS_HEADERS)
 
+    elif function_name == "get_0x_swap_quote_ladder":
+        token = request_args.get("token_contract_address")
+        weth_amounts = request_args.get("weth_amounts_to_spend")
+        taker = request_args.get("taker_address")
+        if not token:
+            return ("Missing token parameter", 400, CORS_HEADERS)
+        if not weth_amounts:
+            return ("Missing weth_amounts parameter", 400, CORS_HEADERS)
+        if not taker:
+            return ("Missing taker parameter", 400, CORS_HEADERS)
+        if isinstance(weth_amounts, str):
+            weth_amounts = weth_amounts.split(",")
+        weth_amounts = [str(amount).strip() for amount in weth_amounts if str(amount).strip()]
+        if len(weth_amounts) > MAX_QUOTE_LADDER_STEPS:
+            return (f"Too many weth_amounts (max {MAX_QUOTE_LADDER_STEPS})", 400, CORS_HEADERS)
+        result = get_0x_swap_quote_ladder(token, weth_amounts, taker)
+        return ({"quotes": result}, 200, CORS_HEADERS)
+
     elif function_name == "generate_jupiter_swap_tx":
         token = request_args.get("output_token_mint")
         lamport_amount_str = request_args.get("lamport_amount_to_sell")
@@ -342,11 +640,41 @@ def api_router(request):
         result = generate_jupiter_swap_tx(token, lamport_amount_int, user_wallet)
         return ({"swap_tx": result}, 200, CORS_HEADERS) if result is not None else ("Error fetching Jupiter swap transaction", 500, CORS_HEADERS)
 
+    elif function_name == "get_jupiter_quote":
+        token = request_args.get("output_token_mint")
+        lamport_amount_str = request_args.get("lamport_amount_to_sell")
+        if not token:
+            return ("Missing token parameter", 400, CORS_HEADERS)
+        if not lamport_amount_str:
+            return ("Missing lamport_amount_str parameter", 400, CORS_HEADERS)
+        try:
+            lamport_amount_int = int(lamport_amount_str)
+        except ValueError:
+            return ("Invalid lamport amount format: must be an integer string.", 400, CORS_HEADERS)
+        if lamport_amount_int <= 0:
+            return ("Invalid lamport amount: must be positive.", 400, CORS_HEADERS)
+
+        result = get_jupiter_quote(token, lamport_amount_int)
+        return ({"quote": result}, 200, CORS_HEADERS)
+
     elif function_name == "send_transaction_Solana":
         tx = request_args.get("signed_transaction_base64")
         if not tx:
             return ("Missing signed_transaction_base64 parameter", 400, CORS_HEADERS)
-        result = send_transaction_Solana(tx)
+        wait = str(request_args.get("wait_for_confirmation", "true")).lower() != "false"
+        result = send_transaction_Solana(tx, wait)
         return ({"signature": result}, 200, CORS_HEADERS) if result is not None else ("Error sending Solana transaction", 500, CORS_HEADERS)
+
+    elif function_name == "get_transaction_status":
+        signatures = request_args.get("signatures")
+        if not signatures:
+            return ("Missing signatures parameter", 400, CORS_HEADERS)
+        if isinstance(signatures, str):
+            signatures = signatures.split(",")
+        signatures = [signature.strip() for signature in signatures if signature and signature.strip()]
+        if len(signatures) > MAX_TRANSACTION_STATUS_SIGNATURES:
+            return (f"Too many signatures (max {MAX_TRANSACTION_STATUS_SIGNATURES})", 400, CORS_HEADERS)
+        result = get_transaction_status_Solana(signatures)
+        return ({"statuses": result}, 200, CORS_HEADERS)
     else:
         return ("Invalid function name specified", 400, CORS_HEADERS)
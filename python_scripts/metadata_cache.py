@@ -0,0 +1,102 @@
+import datetime
+import os
+
+from document_store import DocumentStore
+from moralis_prices import fetch_usd_prices
+
+# --- Token Metadata Cache ---
+# Keeps the Moralis token metadata of trending tokens between ingestion runs, since
+# most tokens stay on the list from one run to the next. METADATA_CACHE_FILE selects
+# the offline JSON file (see document_store.py).
+#
+# Each entry has two ages. Static fields (name, logo, links, description, supply)
+# are re-fetched from the metadata endpoint after METADATA_STATIC_TTL_HOURS. The
+# market cap goes stale much sooner: after METADATA_VOLATILE_TTL_HOURS it is
+# recomputed from the batched price endpoint (moralis_prices.py) and the cached
+# supply, which costs one call per 25 (EVM) or 100 (SOL) tokens instead of a
+# metadata call per 10 or per 1.
+
+METADATA_CACHE_COLLECTION = 'token_metadata_cache'
+METADATA_CACHE_FILE = os.environ.get("METADATA_CACHE_FILE", "")
+METADATA_STATIC_TTL_HOURS = float(os.environ.get("METADATA_STATIC_TTL_HOURS", "168"))
+METADATA_VOLATILE_TTL_HOURS = float(os.environ.get("METADATA_VOLATILE_TTL_HOURS", "1"))
+
+# Per chain: the metadata field holding the supply and the one holding the market cap.
+MARKET_FIELDS = {
+    'eth': ('circulating_supply', 'market_cap'),
+    'sol': ('totalSupplyFormatted', 'fullyDilutedValue'),
+}
+
+
+class MetadataCache(DocumentStore):
+    """(chain, address) -> {'metadata', 'static_fetched_at', 'volatile_fetched_at'}."""
+
+    def __init__(self, db=None, path: str = METADATA_CACHE_FILE):
+        super().__init__(METADATA_CACHE_COLLECTION, db, path)
+
+    @staticmethod
+    def _doc_id(chain: str, address: str) -> str:
+        return f"{chain}_{address}"
+
+    def get_many(self, chain: str, addresses: list[str]) -> dict:
+        by_doc_id = {self._doc_id(chain, address): address for address in addresses}
+        return {by_doc_id[doc_id]: entry for doc_id, entry in self.get_documents(list(by_doc_id)).items()}
+
+    def put_many(self, chain: str, entries: dict):
+        self.set_documents({self._doc_id(chain, address): entry for address, entry in entries.items()})
+
+
+def _age_under(timestamp: str | None, now: datetime.datetime, ttl_hours: float) -> bool:
+    if not timestamp:
+        return False
+    return now - datetime.datetime.fromisoformat(timestamp) < datetime.timedelta(hours=ttl_hours)
+
+
+def load_token_metadata(cache: MetadataCache, chain: str, addresses: list[str], fetch_metadata, api_key: str) -> dict:
+    """
+    Returns {address: metadata} for the tokens, using cached entries where they are
+    fresh, repricing entries whose market cap is stale, and calling
+    fetch_metadata(addresses) -> {address: metadata} only for misses and entries
+    whose static fields expired (or that could not be repriced).
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    entries = cache.get_many(chain, addresses)
+    supply_field, market_cap_field = MARKET_FIELDS[chain]
+
+    to_fetch, to_reprice = [], []
+    for address in addresses:
+        entry = entries.get(address)
+        if not entry or not _age_under(entry.get('static_fetched_at'), now, METADATA_STATIC_TTL_HOURS):
+            to_fetch.append(address)
+        elif not _age_under(entry.get('volatile_fetched_at'), now, METADATA_VOLATILE_TTL_HOURS):
+            to_reprice.append(address)
+
+    fresh_count = len(addresses) - len(to_fetch) - len(to_reprice)
+    updated = {}
+    prices = fetch_usd_prices(chain, to_reprice, api_key) if to_reprice else {}
+    for address in to_reprice:
+        metadata = entries[address]['metadata']
+        try:
+            market_cap = prices[address] * float(metadata[supply_field])
+        except (KeyError, TypeError, ValueError):
+            to_fetch.append(address)
+            continue
+        updated[address] = {
+            **entries[address],
+            'metadata': {**metadata, market_cap_field: str(round(market_cap, 2))},
+            'volatile_fetched_at': now.isoformat(),
+        }
+
+    print(f"Metadata cache: {fresh_count} fresh, "
+          f"{len(updated)} repriced, {len(to_fetch)} fetched from Moralis.")
+    for address, metadata in (fetch_metadata(to_fetch) if to_fetch else {}).items():
+        updated[address] = {
+            'metadata': metadata,
+            'static_fetched_at': now.isoformat(),
+            'volatile_fetched_at': now.isoformat(),
+        }
+
+    cache.put_many(chain, updated)
+    cache.save()
+    entries.update(updated)
+    return {address: entries[address]['metadata'] for address in addresses if address in entries}
@@ -0,0 +1,147 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# --- Latency instrumentation ---
+# Process-wide latency histograms (per api_router route and per upstream) and
+# counters (cache hits/misses). Upstream timings are also collected per request so
+# they can be returned to the browser in a Server-Timing header.
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is unbounded.
+BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# Friendly upstream names for hosts reached through http_transport.
+UPSTREAM_HOSTS = {
+    "deep-index.moralis.io": "moralis",
+    "solana-gateway.moralis.io": "moralis",
+    "api.0x.org": "0x",
+    "lite-api.jup.ag": "jupiter",
+}
+
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, duration_ms: float):
+        self.counts[bisect.bisect_left(BUCKETS_MS, duration_ms)] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Upper bound of the bucket holding the p-th percentile (None if unbounded or empty)."""
+        if not self.count:
+            return None
+        rank = p * self.count
+        seen = 0
+        for bound, bucket_count in zip(BUCKETS_MS + [None], self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else None,
+            "max_ms": round(self.max_ms, 2),
+            "p50_ms": self.percentile(0.5),
+            "p99_ms": self.percentile(0.99),
+            "buckets": {f"le_{bound}": c for bound, c in zip(BUCKETS_MS + ["inf"], self.counts)},
+        }
+
+
+_lock = threading.Lock()
+_histograms: Dict[Tuple[str, str], Histogram] = {}
+_counters: Dict[str, int] = {}
+
+# Upstream timings of the request being handled. Worker threads see the same list
+# when their task is submitted through run_in_context().
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_timings", default=None)
+
+
+def observe(kind: str, name: str, duration_ms: float):
+    with _lock:
+        histogram = _histograms.get((kind, name))
+        if histogram is None:
+            histogram = Histogram()
+            _histograms[(kind, name)] = histogram
+        histogram.observe(duration_ms)
+
+
+def increment(name: str, amount: int = 1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def record_upstream(name: str, duration_ms: float):
+    observe("upstream", name, duration_ms)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, duration_ms))
+
+
+@contextmanager
+def timed_upstream(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_upstream(name, (time.perf_counter() - start) * 1000)
+
+
+def upstream_name_for_host(host: str) -> str:
+    return UPSTREAM_HOSTS.get(host, host)
+
+
+def run_in_context(executor, fn, *args):
+    """Submits fn to executor so its upstream timings count towards the current request."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+class RequestScope:
+
+    def __init__(self, route: str):
+        self.route = route
+        self.start = time.perf_counter()
+        self.timings: List[Tuple[str, float]] = []
+
+    def server_timing(self) -> str:
+        """Server-Timing value: per-upstream total duration and call count, plus the route total."""
+        totals: Dict[str, List[float]] = {}
+        for name, duration_ms in list(self.timings):
+            entry = totals.setdefault(name, [0.0, 0])
+            entry[0] += duration_ms
+            entry[1] += 1
+        parts = [f'{name};dur={total:.1f};desc="{count} call(s)"' for name, (total, count) in totals.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+@contextmanager
+def request_scope(route: str):
+    scope = RequestScope(route)
+    token = _request_timings.set(scope.timings)
+    try:
+        yield scope
+    finally:
+        _request_timings.reset(token)
+        observe("route", route, (time.perf_counter() - scope.start) * 1000)
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            "routes": {name: h.to_dict() for (kind, name), h in _histograms.items() if kind == "route"},
+            "upstreams": {name: h.to_dict() for (kind, name), h in _histograms.items() if kind == "upstream"},
+            "counters": dict(_counters),
+        }
@@ -1,34 +1,74 @@
 import requests
 import json
 import datetime
+import math
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import firestore
 from google.cloud import firestore as gcf_firestore
 
+import http_transport
+import metrics
+from http_transport import backoff_delay, is_transient_error
+from moralis_prices import fetch_usd_prices
+from chart_encoding import CHART_STORAGE_FORMAT, build_chart_document
+from chart_state import ChartState, ChartWriter
+from ohlcv_series import CandleSeries, plan_ohlcv_pages
+from pair_index import PairIndex, is_pair_entry_fresh, pair_entry_from_pair_info, volume_dropped
+from rate_limiter import TokenBucket
+
 # --- Constants ---
-# Two weeks in hours and minutes
-TWO_WEEKS_HOURS = 336
 # The old MAX_DATA_POINTS (20160) is now irrelevant as we no longer store the full 2 weeks of minute data.
 MORALIS_API_KEY = "x"  # Replace with your actual Moralis API Key
 MORALIS_BASE_URL = "https://deep-index.moralis.io/api/v2.2"
+MORALIS_SOLANA_BASE_URL = "https://solana-gateway.moralis.io"
 HEADERS = {
     "accept": "application/json",
     "X-API-Key": MORALIS_API_KEY,
 }
 MAX_LIMIT_PER_REQUEST = 1000  # Max limit for Moralis OHLCV endpoint
+# Attempts per OHLCV page before the token's refresh is abandoned for this run.
+OHLCV_PAGE_MAX_ATTEMPTS = int(os.environ.get("OHLCV_PAGE_MAX_ATTEMPTS", "3"))
+
+# --- Concurrency and Rate Limiting ---
+# Number of tokens refreshed at the same time.
+CHART_WORKERS = int(os.environ.get("CHART_WORKERS", "8"))
+# Tokens whose chart documents are prefetched together with one get_all.
+CHART_BATCH_SIZE = int(os.environ.get("CHART_BATCH_SIZE", "50"))
+# Compute units per second allowed by our Moralis plan, and the CU charged per endpoint.
+MORALIS_CU_PER_SECOND = float(os.environ.get("MORALIS_CU_PER_SECOND", "1000"))
+MORALIS_CU_COST = {
+    "pairs": 50,
+    "ohlcv": 150,
+    "prices": 100,
+}
+# Shared by every worker thread, so the whole run stays within the plan's budget.
+moralis_rate_limiter = TokenBucket(rate=MORALIS_CU_PER_SECOND)
+
+# --- Dirty-Token Detection ---
+# Before fetching OHLCV, each batch's current prices are looked up with the batched
+# price endpoints. A token whose price moved less than this fraction since its chart
+# was last refreshed has not traded meaningfully and is skipped...
+DIRTY_PRICE_TOLERANCE = float(os.environ.get("DIRTY_PRICE_TOLERANCE", "0.001"))
+# ...unless its chart has not been refreshed for this long, so the chart windows still move on.
+CHART_MAX_SKIP_HOURS = float(os.environ.get("CHART_MAX_SKIP_HOURS", "6"))
 
 # --- Chart Timeframe Mapping (Matches client-side in token_details.dart) ---
-# Used for server-side thinning from 1-hour OHLCV data.
-# The index 0 (1H) is generated from 1-minute data and does not need thinning intervals.
+# Used for server-side thinning. Each chart takes the last 'duration_hours' of its
+# source series and, if more than 'max_points' candles remain, downsamples them with
+# LTTB. The charts plot open prices only, so LTTB on the source candles keeps spikes
+# that coarser OHLC buckets would flatten.
+# The index 0 (1H) is generated from 1-minute data, the rest from the hourly ring.
 TIME_FILTER_MAP = [
-    {'key': 'data_1h', 'duration_hours': 1, 'sample_interval': 1}, # This uses 1-minute candles
-    {'key': 'data_6h', 'duration_hours': 6, 'sample_interval': 3}, # Every 3rd 1-minute candle, but we will use 1-hour candles for all these
-    {'key': 'data_12h', 'duration_hours': 12, 'sample_interval': 6},
-    {'key': 'data_1d', 'duration_hours': 24, 'sample_interval': 10},
-    {'key': 'data_1w', 'duration_hours': 168, 'sample_interval': 27},
-    {'key': 'data_2w', 'duration_hours': 336, 'sample_interval': 55},
+    {'key': 'data_1h', 'duration_hours': 1, 'max_points': 60}, # This uses 1-minute candles
+    {'key': 'data_6h', 'duration_hours': 6, 'max_points': 120},
+    {'key': 'data_12h', 'duration_hours': 12, 'max_points': 120},
+    {'key': 'data_1d', 'duration_hours': 24, 'max_points': 144},
+    {'key': 'data_1w', 'duration_hours': 168, 'max_points': 120},
+    {'key': 'data_2w', 'duration_hours': 336, 'max_points': 168},
 ]
 
 
@@ -67,7 +107,6 @@ def get_latest_token_addresses(db: gcf_firestore.Client, chain: str) -> list[dic
     if chain.lower() == 'eth':
         collection_name = 'tokens_by_timestamp'
     elif chain.lower() == 'sol':
-        # TODO: Adjust collection name for SOL if necessary
         collection_name = 'tokens_by_timestamp_SOL'
     else:
         print(f"Unsupported chain: {chain}")
@@ -113,220 +152,371 @@ def get_latest_token_addresses(db: gcf_firestore.Client, chain: str) -> list[dic
         return []
 
 
-def get_latest_chart_timestamp(db: gcf_firestore.Client, contract_address: str) -> datetime.datetime:
-    """
-    Retrieves the latest saved timestamp from the charts collection for a token.
-    Now only tracks the latest timestamp from the 'data_1h' field for continuity.
-    """
-    # We only need the latest timestamp of the 1-hour data to know where to start querying the new minute data.
-    one_hour_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+# --- Moralis API Functions ---
 
-    try:
-        doc_ref = db.collection('charts').document(contract_address)
-        doc = doc_ref.get()
+def moralis_get(url: str, params: dict, endpoint: str) -> requests.Response:
+    """GET against Moralis through the pooled transport, charged against the CU budget."""
+    moralis_rate_limiter.acquire(MORALIS_CU_COST[endpoint])
+    return http_transport.get(url, headers=HEADERS, params=params)
 
-        if doc.exists:
-            data = doc.to_dict()
-            # Check the most granular data field, which is data_1h (contains 1-minute candles)
-            minute_data = data.get('data_1h', [])
+def moralis_fetch_prices(chain: str, addresses: list[str]) -> dict[str, float]:
+    """Batched USD prices (moralis_prices.py), each call charged against the CU budget."""
+    return fetch_usd_prices(chain, addresses, MORALIS_API_KEY,
+                            before_request=lambda: moralis_rate_limiter.acquire(MORALIS_CU_COST["prices"]))
 
-            if minute_data:
-                # Find the latest timestamp in the minute_data array
-                latest_ts_str = max(minute_data, key=lambda x: x.get('timestamp', ''))['timestamp']
 
-                # Convert the ISO 8601 string to a datetime object
-                latest_timestamp = datetime.datetime.fromisoformat(latest_ts_str.replace('Z', '+00:00'))
+# --- Chain Adapters ---
+# Everything chain-specific about charting a token: how its most liquid pair is found
+# and how one page of pair OHLCV is requested. The refresh pipeline below (pair index,
+# incremental ranges, prefetch, worker pool, bulk writes) is shared by every chain.
+# Pairs are normalized to the EVM field names used by the pair index:
+# pair_address, exchange_name, liquidity_usd, volume_24h_usd.
 
-                # We want to start querying *after* this last saved point, so add 1 minute.
-                new_query_start_time = latest_timestamp + datetime.timedelta(minutes=1)
+class EvmChartAdapter:
+    """Moralis EVM API: /erc20/{token}/pairs, /pairs/{pair}/ohlcv and /erc20/prices."""
 
-                print(f"Historical 1-minute data found. Latest saved timestamp: {latest_timestamp.isoformat()}")
+    timeframes = {"minute": "1min", "hour": "1hour"}
 
-                # The floor for the 1-minute query is 1 hour ago.
-                return max(new_query_start_time, one_hour_ago)
+    def __init__(self, chain: str):
+        self.chain = chain
 
-        print(f"No historical data found for {contract_address}. Starting 1-minute query from 1 hour ago.")
-        return one_hour_ago
+    def find_most_liquid_pair(self, token_address: str) -> dict | None:
+        url = f"{MORALIS_BASE_URL}/erc20/{token_address}/pairs"
+        response = moralis_get(url, {"chain": self.chain}, "pairs")
+        response.raise_for_status()
+        return most_liquid(response.json().get("pairs", []))
 
-    except Exception as e:
-        print(f"Error getting latest chart timestamp for {contract_address}: {e}")
-        return one_hour_ago
+    def ohlcv_page(self, pair_address: str, timeframe: str, from_date_str: str, to_date_str: str, cursor: str | None) -> tuple[list[dict], str | None]:
+        """One page of candles. EVM pages are walked by moving toDate back, so no cursor is returned."""
+        url = f"{MORALIS_BASE_URL}/pairs/{pair_address}/ohlcv"
+        params = {
+            "chain": self.chain,
+            "timeframe": self.timeframes[timeframe],
+            "currency": "usd",
+            "fromDate": from_date_str,
+            "toDate": to_date_str,
+            "limit": MAX_LIMIT_PER_REQUEST,
+        }
+        response = moralis_get(url, params, "ohlcv")
+        response.raise_for_status()
+        return response.json().get("result", []), None
 
+    def fetch_prices(self, token_addresses: list[str]) -> dict[str, float]:
+        """{token_address: usd_price} for the tokens Moralis could price."""
+        return moralis_fetch_prices(self.chain, token_addresses)
 
-# --- Moralis API Functions ---
 
-def find_most_liquid_pair(chain: str, token_address: str) -> dict | None:
-    """Finds the most liquid trading pair for a given token contract address."""
-    url = f"{MORALIS_BASE_URL}/erc20/{token_address}/pairs"
-    params = {"chain": chain}
+class SolanaChartAdapter:
+    """Moralis Solana gateway: /token/mainnet/{mint}/pairs, /token/mainnet/pairs/{pair}/ohlcv and /token/mainnet/prices."""
 
-    try:
-        response = requests.get(url, headers=HEADERS, params=params)
+    chain = "sol"
+    timeframes = {"minute": "1min", "hour": "1h"}
+
+    def find_most_liquid_pair(self, token_address: str) -> dict | None:
+        url = f"{MORALIS_SOLANA_BASE_URL}/token/mainnet/{token_address}/pairs"
+        response = moralis_get(url, {}, "pairs")
+        response.raise_for_status()
+        pairs = [
+            {
+                "pair_address": pair.get("pairAddress"),
+                "exchange_name": pair.get("exchangeName"),
+                "liquidity_usd": pair.get("liquidityUsd"),
+                "volume_24h_usd": pair.get("volume24hrUsd"),
+            }
+            for pair in response.json().get("pairs", [])
+            if not pair.get("inactivePair")
+        ]
+        return most_liquid(pairs)
+
+    def ohlcv_page(self, pair_address: str, timeframe: str, from_date_str: str, to_date_str: str, cursor: str | None) -> tuple[list[dict], str | None]:
+        """One page of candles, plus the gateway's cursor for the next page of the same window."""
+        url = f"{MORALIS_SOLANA_BASE_URL}/token/mainnet/pairs/{pair_address}/ohlcv"
+        params = {
+            "timeframe": self.timeframes[timeframe],
+            "currency": "usd",
+            "fromDate": from_date_str,
+            "toDate": to_date_str,
+            "limit": MAX_LIMIT_PER_REQUEST,
+        }
+        if cursor:
+            params["cursor"] = cursor
+        response = moralis_get(url, params, "ohlcv")
         response.raise_for_status()
         data = response.json()
+        return data.get("result", []), data.get("cursor")
 
-        pairs = data.get("pairs", [])
-        if not pairs:
-            return None
+    def fetch_prices(self, token_addresses: list[str]) -> dict[str, float]:
+        """{mint: usd_price} for the tokens Moralis could price."""
+        return moralis_fetch_prices(self.chain, token_addresses)
+
+
+CHART_ADAPTERS = {
+    "eth": EvmChartAdapter("eth"),
+    "sol": SolanaChartAdapter(),
+}
+
+
+def most_liquid(pairs: list[dict]) -> dict | None:
+    if not pairs:
+        return None
 
-        most_liquid_pair = max(
-            pairs,
-            key=lambda pair: pair.get('liquidity_usd', 0.0) if pair.get('liquidity_usd') is not None else -1
-        )
+    most_liquid_pair = max(
+        pairs,
+        key=lambda pair: pair.get('liquidity_usd', 0.0) if pair.get('liquidity_usd') is not None else -1
+    )
+
+    return most_liquid_pair if most_liquid_pair and most_liquid_pair.get('pair_address') else None
 
-        return most_liquid_pair if most_liquid_pair and most_liquid_pair.get('pair_address') else None
 
+def find_most_liquid_pair(adapter, token_address: str) -> dict | None:
+    """Finds the most liquid trading pair for a given token contract address."""
+    try:
+        return adapter.find_most_liquid_pair(token_address)
     except requests.exceptions.RequestException as e:
         print(f"Error finding pair for {token_address}: {e}")
         return None
 
-def get_historical_ohlcv_range(chain: str, pair_address: str, from_date: datetime.datetime, to_date: datetime.datetime, timeframe: str) -> list[dict]:
+def format_moralis_date(date: datetime.datetime) -> str:
+    return date.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def fetch_ohlcv_page(adapter, pair_address: str, timeframe: str, from_date_str: str, to_date_str: str, cursor: str | None) -> tuple[list[dict], str | None]:
+    """
+    One page request, retried with backoff. The transport already retries 429/5xx and
+    connection errors; this also covers pages that still fail afterwards. Other errors
+    (4xx, malformed responses) are permanent and raised at once, as is the last
+    transient one, so a chart is never written from a truncated range.
+    """
+    for attempt in range(OHLCV_PAGE_MAX_ATTEMPTS):
+        try:
+            return adapter.ohlcv_page(pair_address, timeframe, from_date_str, to_date_str, cursor)
+        except requests.exceptions.RequestException as e:
+            if not is_transient_error(e) or attempt + 1 >= OHLCV_PAGE_MAX_ATTEMPTS:
+                raise
+            delay = backoff_delay(attempt + 2)
+            print(f"Error fetching OHLCV page for {pair_address} (attempt {attempt + 1}/{OHLCV_PAGE_MAX_ATTEMPTS}): {e}. Retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def iter_ohlcv_pages(adapter, pair_address: str, from_date: datetime.datetime, to_date: datetime.datetime, timeframe: str):
+    """Yields the candles of each planned page (and of its cursor continuations) as they arrive."""
+    for page_from, page_to in plan_ohlcv_pages(from_date, to_date, timeframe, MAX_LIMIT_PER_REQUEST):
+        from_date_str = format_moralis_date(page_from)
+        to_date_str = format_moralis_date(page_to)
+        cursor = None
+        while True:
+            ohlcv_results, cursor = fetch_ohlcv_page(adapter, pair_address, timeframe, from_date_str, to_date_str, cursor)
+            if ohlcv_results:
+                yield ohlcv_results
+            if not ohlcv_results or not cursor:
+                break
+
+
+def get_historical_ohlcv_range(adapter, pair_address: str, from_date: datetime.datetime, to_date: datetime.datetime, timeframe: str) -> CandleSeries:
     """
     Queries historical OHLCV data for a given pair address within a specific range.
-    Handles pagination backwards from to_date until from_date is reached.
+    The range is split into planned pages up front; each page is folded into a
+    columnar series as it streams in, so raw pages are never all held at once.
     """
-    all_ohlcv_data = []
-    current_request_to_date = to_date
+    pages = plan_ohlcv_pages(from_date, to_date, timeframe, MAX_LIMIT_PER_REQUEST)
+    print(f"Querying {timeframe} OHLCV from {from_date.isoformat(timespec='minutes')} to {to_date.isoformat(timespec='minutes')} in {len(pages)} page(s)")
 
-    print(f"Querying {timeframe} OHLCV from {from_date.isoformat(timespec='minutes')} to {to_date.isoformat(timespec='minutes')}")
+    series = CandleSeries()
+    for ohlcv_results in iter_ohlcv_pages(adapter, pair_address, from_date, to_date, timeframe):
+        series = series.merge(CandleSeries.from_candles(ohlcv_results))
 
-    while current_request_to_date > from_date:
+    # Drop anything the API returned from before from_date
+    series = series.since(math.ceil(from_date.timestamp()))
 
-        # Moralis API call parameters
-        from_date_str = from_date.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
-        to_date_str = current_request_to_date.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+    print(f"Total new {timeframe} OHLCV data points fetched: {len(series)}")
+    return series
 
-        url = f"{MORALIS_BASE_URL}/pairs/{pair_address}/ohlcv"
-        params = {
-            "chain": chain,
-            "timeframe": timeframe,
-            "currency": "usd",
-            "fromDate": from_date_str,
-            "toDate": to_date_str,
-            "limit": MAX_LIMIT_PER_REQUEST,
-        }
 
-        try:
-            response = requests.get(url, headers=HEADERS, params=params)
-            response.raise_for_status()
-            data = response.json()
+def get_pair_for_token(writer: ChartWriter, pair_index: PairIndex, adapter, contract_address: str, entry: dict | None, now: datetime.datetime) -> dict | None:
+    """
+    Returns the token's most liquid pair from its prefetched pair index entry, only
+    calling the Moralis pairs endpoint when the entry is missing, too old or flagged
+    for revalidation. A new entry is queued on the chart writer.
+    """
+    if is_pair_entry_fresh(entry, now):
+        return entry
 
-            ohlcv_results = data.get("result", [])
+    pair_info = find_most_liquid_pair(adapter, contract_address)
+    if pair_info and pair_info.get("pair_address"):
+        entry = pair_entry_from_pair_info(pair_info, now)
+        pair_index.put(adapter.chain, contract_address, entry, writer)
+        return entry
 
-            if not ohlcv_results:
-                break
+    # Lookup failed: keep using the last known pair rather than dropping the chart.
+    return entry if entry and entry.get("pair_address") else None
 
-            # Add new data. Moralis OHLCV returns oldest to newest within the requested window.
-            all_ohlcv_data.extend(ohlcv_results)
 
-            # Find the timestamp of the EARLIEST entry in this batch
-            earliest_timestamp_in_batch_str = min(ohlcv_results, key=lambda x: x['timestamp'])['timestamp']
+# --- Firestore Update Function ---
 
-            # Set the next request's 'toDate' to be 1 millisecond before the earliest entry fetched
-            current_request_to_date = datetime.datetime.fromisoformat(earliest_timestamp_in_batch_str.replace('Z', '+00:00')) - datetime.timedelta(milliseconds=1)
+def build_chart_series(series: CandleSeries, filter_spec: dict, current_time_utc: datetime.datetime) -> CandleSeries:
+    """Window and LTTB-downsample one series into the points of a data_* chart."""
+    window_start = int(current_time_utc.timestamp()) - filter_spec['duration_hours'] * 3600
+    return series.since(window_start).lttb(filter_spec['max_points'])
 
-            # Stop if we've reached or passed the desired starting point
-            if current_request_to_date < from_date:
-                break
 
-            # Add a small delay for rate limit
-            time.sleep(0.1)
+def update_ohlcv_in_firestore(writer: ChartWriter, chart_state: ChartState, current_time_utc: datetime.datetime):
+    """
+    Prunes the merged chart state to the last hour / two weeks, then queues the six
+    pre-thinned charts (data_1h, data_6h, ... data_2w) as one write in the layout
+    chosen by CHART_STORAGE_FORMAT, and the hourly ring and job state as another
+    (chart_state/{contract}), both on the run's bulk writer.
+    """
+    contract_address = chart_state.contract_address
+    charts = {}
 
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching OHLCV data: {e}")
-            break
+    chart_state.prune(current_time_utc)
 
-    # Filter the combined list to ensure correctness and adherence to the from_date
-    final_ohlcv_data = [
-        entry for entry in all_ohlcv_data
-        if datetime.datetime.fromisoformat(entry['timestamp'].replace('Z', '+00:00')) >= from_date
-    ]
+    # --- 1. Process 1-Minute Data for the 'data_1h' Chart ---
+    # The minute series is already pruned to the last 60 candles.
+    charts['data_1h'] = chart_state.minute.lttb(TIME_FILTER_MAP[0]['max_points'])
+    print(f"  Generated 'data_1h' with {len(charts['data_1h'])} points (last 60 mins).")
 
-    print(f"Total new {timeframe} OHLCV data points fetched: {len(final_ohlcv_data)}")
-    return final_ohlcv_data
+    # --- 2. Process 1-Hour Data for Long Timeframe Charts (6H to 2W) ---
+    # Generate the 5 longer timeframe charts (skipping the 1H index 0)
+    for filter_spec in TIME_FILTER_MAP[1:]:
+        key = filter_spec['key']
+        charts[key] = build_chart_series(chart_state.hourly, filter_spec, current_time_utc)
+        print(f"  Generated '{key}' with {len(charts[key])} points (last {filter_spec['duration_hours']} hours).")
 
 
-def fetch_and_get_existing_minute_data(db: gcf_firestore.Client, contract_address: str) -> list[dict]:
-    """Fetches the existing data_1h array from Firestore."""
+    # --- 3. Queue All Six Charts for the Bulk Write to Firestore ---
     try:
-        doc_ref = db.collection('charts').document(contract_address)
-        doc = doc_ref.get()
-        if doc.exists:
-            # We only need the existing 1-minute data for the data_1h chart continuity
-            return doc.to_dict().get('data_1h', [])
+        document = build_chart_document(chart_state.minute, chart_state.hourly, charts)
+        chart_state.save(writer, document, current_time_utc)
+        print(f"Queued {contract_address} update with 6 pre-thinned charts ({CHART_STORAGE_FORMAT} layout).")
     except Exception as e:
-        print(f"Error fetching existing chart data_1h: {e}. Returning empty list.")
-    return []
+        print(f"CRITICAL: Error queueing Firestore write for {contract_address}: {e}")
 
+# --- Dirty-Token Pre-pass ---
+
+def is_token_dirty(chart_state: ChartState, current_price: float | None, now: datetime.datetime) -> bool:
+    """True if the token may have traded since its chart was last refreshed."""
+    if current_price is None or not chart_state.last_price or chart_state.refreshed_at is None:
+        return True
+    if now - chart_state.refreshed_at >= datetime.timedelta(hours=CHART_MAX_SKIP_HOURS):
+        return True
+    return abs(current_price - chart_state.last_price) / chart_state.last_price > DIRTY_PRICE_TOLERANCE
 
-# --- Firestore Update Function ---
 
-def update_ohlcv_in_firestore(db: gcf_firestore.Client, contract_address: str, new_minute_data: list[dict], new_hourly_data: list[dict]):
+def select_dirty_tokens(adapter, batch: list[dict], chart_states: dict[str, ChartState], now: datetime.datetime) -> list[dict]:
     """
-    Merges new 1-minute data with existing, prunes to 1 hour, then uses hourly data
-    to generate and save six pre-thinned chart arrays (data_1h, data_6h, ... data_2w).
+    Prices the whole batch with the chain's batched price endpoint and keeps only the
+    tokens whose price moved (or that cannot be compared). The new prices are recorded
+    on the chart states so the refreshed documents store them.
     """
-    charts_ref = db.collection('charts').document(contract_address)
-    charts_to_save = {}
-
-    # --- 1. Process 1-Minute Data for the 'data_1h' Chart ---
-
-    # Fetch existing minute data (only the last 1-hour worth)
-    existing_minute_data = fetch_and_get_existing_minute_data(db, contract_address)
-
-    # Combine and deduplicate
-    combined_data_map = {}
-    for entry in existing_minute_data + new_minute_data:
-        key = entry.get("timestamp")
-        # Ensure we only store the required fields for the client-side ChartData model: timestamp and open
-        if key:
-            combined_data_map[key] = {"timestamp": key, "open": entry.get("open")}
-
-    # Convert back to a list and sort chronologically
-    sorted_minute_data = sorted(
-        combined_data_map.values(),
-        key=lambda x: datetime.datetime.fromisoformat(x['timestamp'].replace('Z', '+00:00'))
-    )
+    prices = adapter.fetch_prices([token['contract_address'] for token in batch])
+    dirty = []
+    for token in batch:
+        chart_state = chart_states[token['contract_address']]
+        current_price = prices.get(token['contract_address'])
+        if is_token_dirty(chart_state, current_price, now):
+            if current_price is not None:
+                chart_state.last_price = current_price
+            dirty.append(token)
+
+    skipped = len(batch) - len(dirty)
+    metrics.increment(f"chart_tokens_checked_{adapter.chain}", len(batch))
+    metrics.increment(f"chart_tokens_skipped_{adapter.chain}", skipped)
+    print(f"Dirty-token pre-pass: {len(dirty)} of {len(batch)} {adapter.chain.upper()} tokens changed, {skipped} skipped.")
+    return dirty
 
-    # Prune to exactly the last 60 minutes for the 'data_1h' chart
-    charts_to_save['data_1h'] = sorted_minute_data[-60:]
-    print(f"  Generated 'data_1h' with {len(charts_to_save['data_1h'])} points (last 60 mins).")
 
-    # --- 2. Process 1-Hour Data for Long Timeframe Charts (6H to 2W) ---
-
-    # Sort the new hourly data just in case, and convert to the simplified structure
-    sorted_hourly_data = sorted(
-        [{"timestamp": entry['timestamp'], "open": entry['open']} for entry in new_hourly_data],
-        key=lambda x: datetime.datetime.fromisoformat(x['timestamp'].replace('Z', '+00:00'))
-    )
+# --- Main Execution ---
 
-    # Generate the 5 longer timeframe charts (skipping the 1H index 0)
-    # The client-side logic samples every N minutes. Here, we can simply take the last N hours.
-    for i in range(1, len(TIME_FILTER_MAP)):
-        filter_spec = TIME_FILTER_MAP[i]
-        key = filter_spec['key']
-        duration_hours = filter_spec['duration_hours']
+def refresh_token_chart(writer: ChartWriter, pair_index: PairIndex, adapter, token: dict, chart_state: ChartState, pair_entry: dict | None, current_time_utc: datetime.datetime):
+    """Fetches new OHLCV data for one token and queues the rewrite of its chart document."""
+    contract_address = token['contract_address']
+    symbol = token['symbol']
+    print(f"\n[Processing {symbol} ({contract_address[:6]}...)]")
 
-        # Take the last 'duration_hours' of data points from the sorted_hourly_data
-        # Note: 1 data point = 1 hour, so we slice by the number of hours.
-        thinned_data = sorted_hourly_data[-duration_hours:]
+    # 1. Determine the query start time for 1-minute data (last hour) from the prefetched chart
+    minute_start_date = chart_state.minute_query_start(current_time_utc)
+    end_date = current_time_utc
 
-        charts_to_save[key] = thinned_data
-        print(f"  Generated '{key}' with {len(thinned_data)} points (last {duration_hours} hours).")
+    # Check if the start date is in the future or too close to the end date
+    if minute_start_date >= end_date - datetime.timedelta(minutes=1):
+        print(f"  {symbol} minute data is already up to date. Skipping Moralis queries.")
+        return
 
+    # 2. Find the most liquid pair (from the pair index when possible)
+    pair_info = get_pair_for_token(writer, pair_index, adapter, contract_address, pair_entry, current_time_utc)
+
+    if pair_info and pair_info.get("pair_address"):
+        pair_address = pair_info["pair_address"]
+        print(f"  Pair found: {pair_address} ({pair_info.get('exchange_name')})")
+
+        # --- A. Fetch 1-HOUR data newer than the stored two-week ring ---
+        # The ring is used to generate the 6H, 12H, 1D, 1W, 2W charts. Only the first run
+        # for a token fetches the full 336 candles; later runs fetch the last hour or two.
+        hourly_start_date = chart_state.hourly_query_start(current_time_utc)
+        new_hourly_data = get_historical_ohlcv_range(adapter, pair_address, hourly_start_date, end_date, "hour")
+        chart_state.merge_hourly(new_hourly_data)
+
+        # A pair that stopped trading or lost most of its volume gets re-checked next run.
+        if not new_hourly_data or volume_dropped(pair_info, chart_state.hourly):
+            print(f"  Activity dropped on {pair_address}; pair will be revalidated next run.")
+            pair_index.mark_stale(adapter.chain, contract_address, pair_info, writer)
+
+        # --- B. Fetch 1-MINUTE data for the last 1 hour (Granular update) ---
+        # This data is used to update the 1H chart.
+        new_minute_data = get_historical_ohlcv_range(adapter, pair_address, minute_start_date, end_date, "minute")
+        chart_state.merge_minute(new_minute_data)
+
+        if new_minute_data or new_hourly_data:
+            # 3. Pre-process and update all 6 chart arrays in Firestore
+            update_ohlcv_in_firestore(writer, chart_state, current_time_utc)
+        else:
+            print(f"  No new OHLCV data fetched for {symbol} in the required ranges.")
+    else:
+        print(f"  Could not find liquid pair for {symbol}. Skipping OHLCV query.")
 
-    # --- 3. Save All Six Charts to Firestore ---
-    if not charts_to_save:
-        print(f"No data to save for {contract_address}.")
-        return
 
-    try:
-        charts_ref.set(charts_to_save)
-        print(f"Successfully updated {contract_address} with 6 pre-thinned chart arrays.")
-    except Exception as e:
-        print(f"CRITICAL: Error saving data to Firestore for {contract_address}: {e}")
+def refresh_charts(db: gcf_firestore.Client, pair_index: PairIndex, adapter, tokens: list[dict]):
+    """
+    Refreshes many tokens at once on a bounded worker pool. Moralis calls from all
+    workers share moralis_rate_limiter, which replaces the old fixed sleeps.
+    Chart state documents and pair index entries are prefetched per batch of
+    CHART_BATCH_SIZE tokens with chunked get_all calls, and all writes (charts and
+    pair index updates) go through one bulk writer that is flushed at the end.
+    Tokens whose price has not moved since their last refresh are skipped.
+    """
+    current_time_utc = datetime.datetime.now(datetime.timezone.utc)
+    writer = ChartWriter(db)
+
+    with ThreadPoolExecutor(max_workers=CHART_WORKERS) as executor:
+        for i in range(0, len(tokens), CHART_BATCH_SIZE):
+            batch = tokens[i:i + CHART_BATCH_SIZE]
+            chart_states = ChartState.load_many(db, [token['contract_address'] for token in batch])
+            batch = select_dirty_tokens(adapter, batch, chart_states, current_time_utc)
+            pair_entries = pair_index.get_many(adapter.chain, [token['contract_address'] for token in batch])
+
+            futures = {
+                executor.submit(refresh_token_chart, writer, pair_index, adapter, token,
+                                chart_states[token['contract_address']], pair_entries.get(token['contract_address']),
+                                current_time_utc): token
+                for token in batch
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    # One bad token must not abort the rest of the run.
+                    print(f"Error processing {futures[future]['symbol']}: {e}")
+
+    writer.close()
+    print(f"Flushed chart writes for {adapter.chain.upper()}.")
+
+    counters = metrics.snapshot()["counters"]
+    checked = counters.get(f"chart_tokens_checked_{adapter.chain}", 0)
+    if checked:
+        skip_ratio = counters.get(f"chart_tokens_skipped_{adapter.chain}", 0) / checked
+        print(f"{adapter.chain.upper()} chart skip ratio: {skip_ratio:.1%} of {checked} tokens.")
 
-# --- Main Execution ---
 
 def main():
     """Main function to run the scheduled task."""
@@ -335,64 +525,20 @@ def main():
         print("FATAL: Firestore connection failed. Exiting script.")
         return
 
-    # --- 1. Process ETH Tokens ---
-
-    BLOCKCHAIN_ETH = "eth"
-    eth_tokens = get_latest_token_addresses(db, BLOCKCHAIN_ETH)
-
-    print(f"\n--- Starting Data Fetch for {BLOCKCHAIN_ETH.upper()} Tokens ({len(eth_tokens)} found) ---")
+    pair_index = PairIndex(db)
 
-    current_time_utc = datetime.datetime.now(datetime.timezone.utc)
-
-    for token in eth_tokens:
-        contract_address = token['contract_address']
-        symbol = token['symbol']
-        print(f"\n[Processing {symbol} ({contract_address[:6]}...)]")
-
-        # 1. Determine the query start time for 1-minute data (last hour)
-        minute_start_date = get_latest_chart_timestamp(db, contract_address)
-        end_date = current_time_utc
-
-        # Check if the start date is in the future or too close to the end date
-        if minute_start_date >= end_date - datetime.timedelta(minutes=1):
-            print(f"  {symbol} minute data is already up to date. Skipping Moralis queries.")
-            continue # Move to the next token
-
-        # 2. Find the most liquid pair
-        pair_info = find_most_liquid_pair(BLOCKCHAIN_ETH, contract_address)
-
-        if pair_info and pair_info.get("pair_address"):
-            pair_address = pair_info["pair_address"]
-            print(f"  Pair found: {pair_address} ({pair_info.get('exchange_name')})")
-
-            # --- A. Fetch 1-HOUR data for the full 2-week history (Low cost, 336 points max) ---
-            # This data is used to generate the 6H, 12H, 1D, 1W, 2W charts.
-            hourly_start_date = current_time_utc - datetime.timedelta(hours=TWO_WEEKS_HOURS)
-            new_hourly_data = get_historical_ohlcv_range(BLOCKCHAIN_ETH, pair_address, hourly_start_date, end_date, "1hour")
-
-            # --- B. Fetch 1-MINUTE data for the last 1 hour (Granular update) ---
-            # This data is used to update the 1H chart.
-            new_minute_data = get_historical_ohlcv_range(BLOCKCHAIN_ETH, pair_address, minute_start_date, end_date, "1min")
-
-            if new_minute_data or new_hourly_data:
-                # 3. Pre-process and update all 6 chart arrays in Firestore
-                update_ohlcv_in_firestore(db, contract_address, new_minute_data, new_hourly_data)
-            else:
-                print(f"  No new OHLCV data fetched for {symbol} in the required ranges.")
-        else:
-            print(f"  Could not find liquid pair for {symbol}. Skipping OHLCV query.")
+    # --- Process ETH, then SOL Tokens through the same pipeline ---
+    for chain, adapter in CHART_ADAPTERS.items():
+        tokens = get_latest_token_addresses(db, chain)
 
-        # Add a small delay between processing tokens to respect potential API burst limits
-        time.sleep(0.5)
+        print(f"\n--- Starting Data Fetch for {chain.upper()} Tokens ({len(tokens)} found) ---")
 
-    # --- 2. Process SOL Tokens (TODO) ---
+        refresh_charts(db, pair_index, adapter, tokens)
 
-    print("\n" + "="*50)
-    print("TODO: Implement Solana (SOL) Token Processing Here.")
-    print("="*50 + "\n")
+    pair_index.save()
 
     print("Script finished successfully.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
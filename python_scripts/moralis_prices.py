@@ -0,0 +1,67 @@
+import json
+
+import requests
+
+import http_transport
+
+# --- Moralis Batched Prices ---
+# The one client for Moralis's multi-token price endpoints, shared by the router's
+# get_token_prices (main.py), the metadata cache's repricing (metadata_cache.py) and
+# the chart job's dirty-token check (moralis_historical_prices_api.py). Chains are
+# 'eth' (POST /erc20/prices) or 'sol' (POST /token/mainnet/prices on the gateway).
+
+MORALIS_EVM_PRICES_URL = "https://deep-index.moralis.io/api/v2.2/erc20/prices"
+MORALIS_SOLANA_PRICES_URL = "https://solana-gateway.moralis.io/token/mainnet/prices"
+# Addresses accepted by one call to each endpoint.
+MORALIS_PRICE_BATCH_SIZE = {'eth': 25, 'sol': 100}
+
+
+def _match_key(chain: str, address: str) -> str:
+    # EVM addresses come back checksummed or lowercased; Solana mints are case-sensitive.
+    return address if chain == 'sol' else address.lower()
+
+
+def fetch_usd_prices_chunk(chain: str, addresses: list[str], api_key: str, before_request=None) -> dict[str, float]:
+    """
+    {address: usd_price} for at most MORALIS_PRICE_BATCH_SIZE[chain] addresses, keyed
+    as the caller passed them; tokens Moralis could not price are left out.
+    before_request() is called right before the POST (e.g. to charge a rate limiter).
+    Raises requests.exceptions.RequestException, or ValueError / TypeError on a malformed response.
+    """
+    if chain == 'sol':
+        url, params, body = MORALIS_SOLANA_PRICES_URL, {}, {"addresses": addresses}
+    else:
+        url, params = MORALIS_EVM_PRICES_URL, {"chain": chain}
+        body = {"tokens": [{"token_address": address} for address in addresses]}
+    headers = {
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+        "X-API-Key": api_key,
+    }
+
+    if before_request is not None:
+        before_request()
+    # Price lookups are read-only, so the POST can be retried.
+    response = http_transport.post(url, headers=headers, params=params, data=json.dumps(body), retry_non_idempotent=True)
+    response.raise_for_status()
+
+    by_key = {_match_key(chain, address): address for address in addresses}
+    prices = {}
+    for item in response.json():
+        address = by_key.get(_match_key(chain, item.get("tokenAddress") or ""))
+        if address and item.get("usdPrice") is not None:
+            prices[address] = float(item["usdPrice"])
+    return prices
+
+
+def fetch_usd_prices(chain: str, addresses: list[str], api_key: str, before_request=None) -> dict[str, float]:
+    """Prices any number of addresses chunk by chunk; a failed chunk just leaves its tokens unpriced."""
+    prices = {}
+    batch_size = MORALIS_PRICE_BATCH_SIZE[chain]
+    for i in range(0, len(addresses), batch_size):
+        chunk = addresses[i:i + batch_size]
+        try:
+            prices.update(fetch_usd_prices_chunk(chain, chunk, api_key, before_request))
+        except (requests.exceptions.RequestException, ValueError, TypeError) as e:
+            print(f"Error fetching token prices for batch starting with {chunk[0]}: {e}")
+    return prices
@@ -0,0 +1,203 @@
+import array
+import bisect
+import datetime
+import math
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the pure-Python paths give the same results.
+    np = None
+
+# --- Columnar OHLCV Series ---
+# Candles stored as parallel columns: epoch-second timestamps plus float
+# open/high/low/close/volume. Columns are NumPy arrays when NumPy is installed and
+# array.array otherwise. Timestamps are parsed from ISO strings once, on the way in,
+# and formatted again only on the way out.
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def parse_timestamp(timestamp: str) -> int:
+    """Moralis ISO 8601 timestamp ('...Z') -> epoch seconds."""
+    return int(datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp())
+
+
+def format_timestamp(epoch: int) -> str:
+    """Epoch seconds -> ISO 8601 in the format Moralis returns ('2025-01-01T00:00:00.000Z')."""
+    return datetime.datetime.fromtimestamp(int(epoch), tz=datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def _int_column(values):
+    return np.asarray(values, dtype=np.int64) if np is not None else array.array('q', values)
+
+
+def _float_column(values):
+    return np.asarray(values, dtype=np.float64) if np is not None else array.array('d', values)
+
+
+class CandleSeries:
+    """Sorted, de-duplicated OHLCV candles in columnar form."""
+
+    def __init__(self, timestamps=(), open=(), high=(), low=(), close=(), volume=()):
+        self.timestamps = _int_column(timestamps)
+        self.open = _float_column(open)
+        self.high = _float_column(high)
+        self.low = _float_column(low)
+        self.close = _float_column(close)
+        self.volume = _float_column(volume)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def from_candles(cls, candles: list[dict]) -> "CandleSeries":
+        """
+        Builds a series from Moralis-style dicts. Later duplicates win. Candles that only
+        carry an open price (older chart documents) use it for high/low/close.
+        """
+        by_timestamp = {}
+        for candle in candles:
+            timestamp = candle.get('timestamp')
+            open_price = candle.get('open')
+            if not timestamp or open_price is None:
+                continue
+            open_price = float(open_price)
+            by_timestamp[parse_timestamp(timestamp)] = (
+                open_price,
+                float(candle['high']) if candle.get('high') is not None else open_price,
+                float(candle['low']) if candle.get('low') is not None else open_price,
+                float(candle['close']) if candle.get('close') is not None else open_price,
+                float(candle.get('volume') or 0.0),
+            )
+        timestamps = sorted(by_timestamp)
+        columns = list(zip(*(by_timestamp[ts] for ts in timestamps))) or [()] * len(FIELDS)
+        return cls(timestamps, *columns)
+
+    def _columns(self):
+        return [self.timestamps, self.open, self.high, self.low, self.close, self.volume]
+
+    def take(self, indices) -> "CandleSeries":
+        if np is not None:
+            indices = np.asarray(indices, dtype=np.int64)
+            return CandleSeries(*(column[indices] for column in self._columns()))
+        return CandleSeries(*([column[i] for i in indices] for column in self._columns()))
+
+    def _slice(self, start: int, stop: int) -> "CandleSeries":
+        return CandleSeries(*(column[start:stop] for column in self._columns()))
+
+    @property
+    def last_timestamp(self) -> int | None:
+        return int(self.timestamps[-1]) if len(self) else None
+
+    def since(self, epoch: int) -> "CandleSeries":
+        """Candles with timestamp >= epoch."""
+        if np is not None:
+            start = int(np.searchsorted(self.timestamps, epoch, side='left'))
+        else:
+            start = bisect.bisect_left(self.timestamps, epoch)
+        return self._slice(start, len(self))
+
+    def tail(self, count: int) -> "CandleSeries":
+        return self._slice(max(0, len(self) - count), len(self))
+
+    def merge(self, other: "CandleSeries") -> "CandleSeries":
+        """Union of both series, sorted by time. Where timestamps collide, `other` wins."""
+        if not len(other):
+            return self
+        if not len(self):
+            return other
+        if np is not None:
+            timestamps = np.concatenate([self.timestamps, other.timestamps])
+            priority = np.concatenate([np.zeros(len(self), dtype=np.int8), np.ones(len(other), dtype=np.int8)])
+            order = np.lexsort((priority, timestamps))
+            sorted_ts = timestamps[order]
+            # Keep the last (highest priority) entry of every run of equal timestamps.
+            keep = np.append(sorted_ts[1:] != sorted_ts[:-1], True)
+            chosen = order[keep]
+            return CandleSeries(*(np.concatenate([mine, theirs])[chosen]
+                                  for mine, theirs in zip(self._columns(), other._columns())))
+        rows = {}
+        for series in (self, other):
+            for i in range(len(series)):
+                rows[series.timestamps[i]] = tuple(column[i] for column in series._columns()[1:])
+        timestamps = sorted(rows)
+        return CandleSeries(timestamps, *zip(*(rows[ts] for ts in timestamps)))
+
+    def lttb(self, target_points: int, field: str = 'open') -> "CandleSeries":
+        """
+        Largest-Triangle-Three-Buckets downsampling on `field` to at most target_points
+        candles, keeping the first and last candle and the visually significant ones.
+        """
+        length = len(self)
+        if target_points >= length:
+            return self
+        if target_points < 3:
+            return self.take([0, length - 1][:max(target_points, 0)])
+        x = [float(ts) for ts in self.timestamps]
+        y = [float(value) for value in getattr(self, field)]
+        every = (length - 2) / (target_points - 2)
+        selected = [0]
+        a = 0
+        for i in range(target_points - 2):
+            # Average of the next bucket is the third triangle vertex.
+            next_start = int((i + 1) * every) + 1
+            next_end = min(int((i + 2) * every) + 1, length)
+            avg_x = sum(x[next_start:next_end]) / (next_end - next_start)
+            avg_y = sum(y[next_start:next_end]) / (next_end - next_start)
+
+            start = int(i * every) + 1
+            end = int((i + 1) * every) + 1
+            best, best_area = start, -1.0
+            for j in range(start, end):
+                area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+                if area > best_area:
+                    best, best_area = j, area
+            selected.append(best)
+            a = best
+        selected.append(length - 1)
+        return self.take(selected)
+
+    def to_points(self, field: str = 'open') -> list[dict]:
+        """The {timestamp, <field>} list the Flutter ChartData model reads."""
+        values = getattr(self, field)
+        return [{'timestamp': format_timestamp(self.timestamps[i]), field: float(values[i])} for i in range(len(self))]
+
+    def to_candles(self) -> list[dict]:
+        columns = self._columns()
+        return [
+            {'timestamp': format_timestamp(self.timestamps[i]),
+             **{field: float(column[i]) for field, column in zip(FIELDS, columns[1:])}}
+            for i in range(len(self))
+        ]
+
+
+# --- OHLCV Page Planning ---
+
+# Candle length of each logical timeframe, used to plan OHLCV pages.
+TIMEFRAME_SECONDS = {"minute": 60, "hour": 3600}
+
+
+def plan_ohlcv_pages(from_date: datetime.datetime, to_date: datetime.datetime, timeframe: str,
+                     limit: int) -> list[tuple[datetime.datetime, datetime.datetime]]:
+    """
+    Splits [from_date, to_date] into the fewest request windows that each hold at most
+    `limit` candles, oldest first. Inner window edges fall just before a candle
+    boundary so no candle is requested twice.
+    """
+    if to_date <= from_date:
+        return []
+    step = TIMEFRAME_SECONDS[timeframe]
+    # First candle boundary at or after from_date
+    first_candle = math.ceil(from_date.timestamp() / step) * step
+    page_span = step * limit
+
+    pages = []
+    page_start = from_date
+    boundary = first_candle + page_span
+    while boundary <= to_date.timestamp():
+        next_start = datetime.datetime.fromtimestamp(boundary, tz=datetime.timezone.utc)
+        pages.append((page_start, next_start - datetime.timedelta(milliseconds=1)))
+        page_start = next_start
+        boundary += page_span
+    pages.append((page_start, to_date))
+    return pages
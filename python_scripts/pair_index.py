@@ -0,0 +1,68 @@
+import datetime
+import os
+
+from document_store import DocumentStore
+
+# --- Pair Index ---
+# Remembers each token's most liquid trading pair so the chart job does not have to
+# look it up on every run. PAIR_INDEX_FILE selects the offline JSON file (see document_store.py).
+
+PAIR_INDEX_COLLECTION = 'pair_index'
+PAIR_INDEX_FILE = os.environ.get("PAIR_INDEX_FILE", "")
+# How long a stored pair is trusted before it is looked up again.
+PAIR_INDEX_REVALIDATE_HOURS = float(os.environ.get("PAIR_INDEX_REVALIDATE_HOURS", "24"))
+# If the pair's recent 24h volume falls below this fraction of the volume seen when the
+# pair was chosen, liquidity has probably moved elsewhere and the pair is re-checked.
+PAIR_VOLUME_DROP_RATIO = float(os.environ.get("PAIR_VOLUME_DROP_RATIO", "0.2"))
+
+
+class PairIndex(DocumentStore):
+    """Index of (chain, contract) -> most liquid pair, with the liquidity seen and when it was checked."""
+
+    def __init__(self, db=None, path: str = PAIR_INDEX_FILE):
+        super().__init__(PAIR_INDEX_COLLECTION, db, path)
+
+    @staticmethod
+    def _doc_id(chain: str, contract_address: str) -> str:
+        return f"{chain}_{contract_address}"
+
+    def get(self, chain: str, contract_address: str) -> dict | None:
+        return self.get_document(self._doc_id(chain, contract_address))
+
+    def get_many(self, chain: str, contract_addresses: list[str]) -> dict:
+        """{contract_address: entry} for a whole token batch, read with chunked get_all calls."""
+        by_doc_id = {self._doc_id(chain, address): address for address in contract_addresses}
+        return {by_doc_id[doc_id]: entry for doc_id, entry in self.get_documents(list(by_doc_id)).items()}
+
+    def put(self, chain: str, contract_address: str, entry: dict, writer=None):
+        self.set_document(self._doc_id(chain, contract_address), entry, writer)
+
+    def mark_stale(self, chain: str, contract_address: str, entry: dict, writer=None):
+        """Forces the pair to be looked up again on the next run."""
+        self.put(chain, contract_address, {**entry, 'needs_revalidation': True}, writer)
+
+
+def is_pair_entry_fresh(entry: dict | None, now: datetime.datetime) -> bool:
+    if not entry or entry.get('needs_revalidation') or not entry.get('checked_at'):
+        return False
+    checked_at = datetime.datetime.fromisoformat(entry['checked_at'])
+    return now - checked_at < datetime.timedelta(hours=PAIR_INDEX_REVALIDATE_HOURS)
+
+
+def pair_entry_from_pair_info(pair_info: dict, now: datetime.datetime) -> dict:
+    return {
+        'pair_address': pair_info.get('pair_address'),
+        'exchange_name': pair_info.get('exchange_name'),
+        'liquidity_usd': pair_info.get('liquidity_usd'),
+        'volume_24h_usd': pair_info.get('volume_24h_usd'),
+        'checked_at': now.isoformat(),
+    }
+
+
+def volume_dropped(entry: dict, hourly_series) -> bool:
+    """True if the last 24 hourly candles traded far less than when the pair was chosen."""
+    observed_volume = entry.get('volume_24h_usd')
+    if not observed_volume or not len(hourly_series):
+        return False
+    recent_volume = float(sum(hourly_series.tail(24).volume))
+    return recent_volume < float(observed_volume) * PAIR_VOLUME_DROP_RATIO
@@ -0,0 +1,35 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter.
+    Tokens refill continuously at `rate` per second up to `capacity`. acquire(cost)
+    blocks until `cost` tokens are available, so callers can charge each request
+    what it really costs (e.g. Moralis compute units) instead of sleeping a fixed time.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, cost: float = 1.0):
+        # A request larger than the bucket could never be served; cap it at capacity.
+        cost = min(cost, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= cost:
+                    self._tokens -= cost
+                    return
+                wait = (cost - self._tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,189 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Tuple, Iterable, Optional
+
+from google.cloud import secretmanager
+
+import metrics
+
+# --- Configuration ---
+# How long a fetched secret is served from memory before it must be re-read.
+SECRET_TTL_SECONDS = float(os.environ.get("SECRET_TTL_SECONDS", "900"))
+# Once an entry is older than this fraction of its TTL, the next read triggers a
+# background refresh while the cached value keeps being served.
+SECRET_REFRESH_FRACTION = float(os.environ.get("SECRET_REFRESH_FRACTION", "0.8"))
+# "secret_manager" (default) or "local" for the offline file/env stand-in.
+SECRETS_BACKEND = os.environ.get("SECRETS_BACKEND", "secret_manager")
+# JSON file of {"SECRET_ID": "value"} used by the local backend.
+SECRETS_FILE = os.environ.get("SECRETS_FILE", "")
+
+
+# --- Backends ---
+
+class SecretManagerBackend:
+    """Reads secrets from Google Cloud Secret Manager using one shared client."""
+
+    def __init__(self):
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def _get_client(self) -> secretmanager.SecretManagerServiceClient:
+        # Creating the client is expensive (credentials, channel setup), so it is
+        # built once per instance and reused by every request thread.
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = secretmanager.SecretManagerServiceClient()
+        return self._client
+
+    def fetch(self, project_id: str, secret_id: str) -> str:
+        name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
+        response = self._get_client().access_secret_version(request={"name": name})
+        return response.payload.data.decode("UTF-8")
+
+
+class LocalSecretBackend:
+    """
+    Offline stand-in for Secret Manager.
+    Looks the secret up in the JSON file at SECRETS_FILE first, then falls back to
+    an environment variable with the same name as the secret.
+    """
+
+    def __init__(self, path: str = SECRETS_FILE):
+        self._values: Dict[str, str] = {}
+        if path:
+            with open(path, "r") as f:
+                self._values = json.load(f)
+
+    def fetch(self, project_id: str, secret_id: str) -> str:
+        if secret_id in self._values:
+            return str(self._values[secret_id])
+        value = os.environ.get(secret_id)
+        if value is None:
+            raise KeyError(f"Secret {secret_id} not found in local secret store")
+        return value
+
+
+# --- Cache ---
+
+class SecretStore:
+    """
+    Process-wide, thread-safe secret cache.
+    Entries are served from memory for `ttl` seconds. Reads in the last part of an
+    entry's lifetime schedule a background refresh, so request threads only block
+    on the backend for the very first read of a secret (or after a long idle).
+    """
+
+    def __init__(self, backend, ttl: float = SECRET_TTL_SECONDS, refresh_fraction: float = SECRET_REFRESH_FRACTION):
+        self._backend = backend
+        self._ttl = ttl
+        self._refresh_after = ttl * refresh_fraction
+        self._entries: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self._key_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+    def _key_lock(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def _load(self, key: Tuple[str, str]) -> str:
+        with metrics.timed_upstream("secret"):
+            value = self._backend.fetch(*key)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+        return value
+
+    def _refresh(self, key: Tuple[str, str]):
+        try:
+            self._load(key)
+        except Exception as e:
+            # Keep serving the current value; it is retried on the next read.
+            print(f"Background refresh failed for secret {key[1]}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _refresh_in_background(self, key: Tuple[str, str]):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key,), daemon=True).start()
+
+    def get_if_fresh(self, project_id: str, secret_id: str) -> Optional[str]:
+        """The cached value if it has not expired, else None. Never blocks on a fetch."""
+        key = (project_id, secret_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, fetched_at = entry
+        age = time.monotonic() - fetched_at
+        if age >= self._ttl:
+            return None
+        if age >= self._refresh_after:
+            self._refresh_in_background(key)
+        metrics.increment("secret_cache_hit")
+        return value
+
+    def get(self, project_id: str, secret_id: str) -> str:
+        value = self.get_if_fresh(project_id, secret_id)
+        if value is not None:
+            return value
+
+        key = (project_id, secret_id)
+        metrics.increment("secret_cache_miss")
+        # Missing or expired: fetch synchronously, but only once per key even if
+        # several request threads arrive at the same time.
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self._ttl:
+                return entry[0]
+            try:
+                return self._load(key)
+            except Exception:
+                if entry is not None:
+                    # Secrets rarely rotate; an expired value beats failing the request.
+                    print(f"Serving expired value for secret {secret_id} after fetch failure.")
+                    return entry[0]
+                raise
+
+    def warm(self, project_id: str, secret_ids: Iterable[str]):
+        """Prefetches secrets on a background thread so the first request finds them cached."""
+        def _warm():
+            for secret_id in secret_ids:
+                try:
+                    self.get(project_id, secret_id)
+                except Exception as e:
+                    print(f"Error warming secret {secret_id}: {e}")
+        threading.Thread(target=_warm, daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _default_backend():
+    if SECRETS_BACKEND == "local":
+        return LocalSecretBackend()
+    return SecretManagerBackend()
+
+
+# One store per process, shared by every request the instance serves.
+secret_store = SecretStore(_default_backend())
+
+
+def get_cached_secret(project_id: str, secret_id: str) -> str:
+    return secret_store.get(project_id, secret_id)
+
+
+def peek_cached_secret(project_id: str, secret_id: str) -> Optional[str]:
+    return secret_store.get_if_fresh(project_id, secret_id)
+
+
+def warm_secrets(project_id: str, secret_ids: Iterable[str]):
+    secret_store.warm(project_id, list(secret_ids))
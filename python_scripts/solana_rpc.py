@@ -0,0 +1,172 @@
+import os
+import re
+import threading
+import time
+from typing import Callable, List, Optional
+
+import httpx
+from solana.exceptions import SolanaRpcException
+from solana.rpc.api import Client
+
+import metrics
+
+# --- Configuration ---
+# Comma-separated list of RPC endpoints, tried in order. "{SECRET_ID}" placeholders
+# are filled in from Secret Manager, e.g. the Helius API key.
+SOLANA_RPC_URLS = os.environ.get(
+    "SOLANA_RPC_URLS",
+    "https://mainnet.helius-rpc.com/?api-key={HELIUS_API_KEY}"
+)
+SOLANA_RPC_TIMEOUT = float(os.environ.get("SOLANA_RPC_TIMEOUT", "10"))
+# How often an endpoint in use gets a getHealth check. Checks run on a background
+# thread, so requests never wait for them, and only when there is an endpoint to fail over to.
+SOLANA_RPC_HEALTH_INTERVAL = float(os.environ.get("SOLANA_RPC_HEALTH_INTERVAL", "30"))
+# How long an endpoint is skipped after a failed call or health check.
+SOLANA_RPC_COOLDOWN = float(os.environ.get("SOLANA_RPC_COOLDOWN", "30"))
+
+_PLACEHOLDER = re.compile(r"\{([A-Za-z0-9_]+)\}")
+
+
+class _Endpoint:
+    def __init__(self, url: str):
+        self.url = url
+        # solana-py's Client keeps a persistent httpx connection pool, so reusing
+        # one Client per endpoint keeps the TLS connection to the RPC node alive.
+        self.client = Client(url, timeout=SOLANA_RPC_TIMEOUT)
+        # Request threads and health check threads share the timestamps below.
+        self._lock = threading.Lock()
+        self._last_checked = 0.0
+        self._failed_until = 0.0
+        self._checking = False
+
+    def mark_failed(self):
+        with self._lock:
+            self._failed_until = time.monotonic() + SOLANA_RPC_COOLDOWN
+
+    def is_available(self) -> bool:
+        """False while the endpoint is cooling down after a failed call or health check."""
+        with self._lock:
+            return time.monotonic() >= self._failed_until
+
+    def claim_health_check(self) -> bool:
+        """True if the caller should run a health check now: one is due and none is running."""
+        with self._lock:
+            now = time.monotonic()
+            if self._checking or now - self._last_checked < SOLANA_RPC_HEALTH_INTERVAL:
+                return False
+            self._checking = True
+            self._last_checked = now
+            return True
+
+    def check_health(self):
+        try:
+            healthy = self.client.is_connected()
+        except Exception:
+            healthy = False
+        if not healthy:
+            print("Solana RPC endpoint failed health check, failing over.")
+            self.mark_failed()
+        with self._lock:
+            self._checking = False
+
+
+def is_transport_error(error: Exception) -> bool:
+    """
+    True for failures of the endpoint itself (connection errors, timeouts, 429/5xx),
+    which solana-py raises as SolanaRpcException wrapping the httpx error. RPC errors
+    about the request (preflight failures, UnconfirmedTxError, ...) are not.
+    """
+    if not isinstance(error, SolanaRpcException):
+        return isinstance(error, httpx.TransportError)
+    cause = error.__cause__
+    if isinstance(cause, httpx.HTTPStatusError):
+        status = cause.response.status_code
+        return status == 429 or status >= 500
+    return cause is None or isinstance(cause, httpx.TransportError)
+
+
+class SolanaRpcManager:
+    """
+    Lazily built, process-wide set of Solana RPC clients with background health
+    checking and failover. Endpoints are created on first use and shared by every request.
+    """
+
+    def __init__(self, secret_resolver: Callable[[str], Optional[str]], urls: str = SOLANA_RPC_URLS):
+        self._secret_resolver = secret_resolver
+        self._urls = urls
+        self._endpoints: Optional[List[_Endpoint]] = None
+        self._lock = threading.Lock()
+
+    def _resolve_url(self, template: str) -> Optional[str]:
+        missing = []
+
+        def _fill(match):
+            value = self._secret_resolver(match.group(1))
+            if not value:
+                missing.append(match.group(1))
+                return ""
+            return value
+
+        url = _PLACEHOLDER.sub(_fill, template)
+        if missing:
+            print(f"Skipping Solana RPC endpoint, missing secrets: {', '.join(missing)}")
+            return None
+        return url
+
+    def _get_endpoints(self) -> List[_Endpoint]:
+        if self._endpoints is None:
+            with self._lock:
+                if self._endpoints is None:
+                    endpoints = []
+                    for template in self._urls.split(","):
+                        template = template.strip()
+                        url = self._resolve_url(template) if template else None
+                        if url:
+                            endpoints.append(_Endpoint(url))
+                    if not endpoints:
+                        # Leave _endpoints unset so the next request retries the secret lookup.
+                        raise RuntimeError("No Solana RPC endpoint could be configured.")
+                    self._endpoints = endpoints
+        return self._endpoints
+
+    def _candidates(self, endpoints: List[_Endpoint]):
+        """
+        Endpoints that are not cooling down, in order and evaluated lazily, so a request
+        stops at the first one that answers. Each one reached is given a background
+        health check when one is due. If every endpoint is cooling down they are all
+        tried anyway.
+        """
+        found = False
+        for endpoint in endpoints:
+            if not endpoint.is_available():
+                continue
+            found = True
+            # With a single endpoint there is nothing to fail over to, so no check.
+            if len(endpoints) > 1 and endpoint.claim_health_check():
+                threading.Thread(target=endpoint.check_health, daemon=True).start()
+            yield endpoint
+        if not found:
+            yield from endpoints
+
+    def call(self, fn: Callable[[Client], object]):
+        """
+        Runs fn(client) against the first available endpoint, failing over to the next
+        one on transport errors. Errors about the request itself are raised at once,
+        without blaming the endpoint.
+        """
+        last_error = None
+        for endpoint in self._candidates(self._get_endpoints()):
+            try:
+                with metrics.timed_upstream("helius"):
+                    return fn(endpoint.client)
+            except Exception as e:
+                if not is_transport_error(e):
+                    raise
+                print(f"Solana RPC call failed: {e}")
+                endpoint.mark_failed()
+                last_error = e
+        raise last_error
+
+    def client(self) -> Client:
+        """Returns the client of the first available endpoint, for calls that do not need failover."""
+        return next(self._candidates(self._get_endpoints())).client
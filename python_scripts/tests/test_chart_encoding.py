@@ -0,0 +1,73 @@
+import chart_encoding
+from chart_encoding import (COMPACT_ENCODING, build_chart_document, decode_chart_document,
+                            decode_source_series, encode_chart_document)
+from ohlcv_series import CandleSeries, format_timestamp
+
+NOW = 1_736_899_200  # 2025-01-15T00:00:00Z
+
+
+def _series(count: int, step: int, end: int, seed: float = 1.0, with_ohlc: bool = True) -> CandleSeries:
+    candles = []
+    for i in range(count, 0, -1):
+        price = seed * (1 + (i % 7) / 100)
+        candle = {'timestamp': format_timestamp(end - i * step), 'open': price}
+        if with_ohlc:
+            candle.update(high=price * 1.1, low=price * 0.9, close=price, volume=float(i))
+        candles.append(candle)
+    return CandleSeries.from_candles(candles)
+
+
+def _charts(minute: CandleSeries, hourly: CandleSeries) -> dict:
+    charts = {'data_1h': minute}
+    for key, hours, points in (('data_6h', 6, 120), ('data_1d', 24, 144), ('data_2w', 336, 168)):
+        charts[key] = hourly.since(NOW - hours * 3600).lttb(points)
+    return charts
+
+
+def test_compact_document_round_trips_to_the_legacy_layout():
+    minute = _series(60, 60, NOW, with_ohlc=False)
+    hourly = _series(336, 3600, NOW, seed=0.0001)
+    charts = _charts(minute, hourly)
+
+    compact = encode_chart_document(minute, hourly, charts)
+
+    assert compact['encoding'] == COMPACT_ENCODING
+    assert decode_chart_document(compact) == {key: points.to_points('open') for key, points in charts.items()}
+    # Every range here is a subset of its source, so none is stored inline.
+    assert all('series' in encoded for encoded in compact['ranges'].values())
+
+
+def test_source_series_round_trip_opens():
+    minute = _series(60, 60, NOW, with_ohlc=False)
+    hourly = _series(336, 3600, NOW)
+    decoded_minute, decoded_hourly = decode_source_series(encode_chart_document(minute, hourly, {}))
+
+    assert decoded_minute.to_points('open') == minute.to_points('open')
+    assert decoded_hourly.to_points('open') == hourly.to_points('open')
+
+
+def test_points_missing_from_the_source_are_stored_inline():
+    hourly = _series(48, 3600, NOW)
+    other = _series(5, 3600, NOW, seed=2.0)
+    compact = encode_chart_document(CandleSeries(), hourly, {'data_6h': other})
+
+    assert 'series' not in compact['ranges']['data_6h']
+    assert decode_chart_document(compact) == {'data_6h': other.to_points('open')}
+
+
+def test_empty_series_round_trip():
+    compact = encode_chart_document(CandleSeries(), CandleSeries(), {'data_1h': CandleSeries()})
+    assert decode_chart_document(compact) == {'data_1h': []}
+
+
+def test_build_chart_document_follows_storage_format(monkeypatch):
+    minute = _series(60, 60, NOW, with_ohlc=False)
+    hourly = _series(336, 3600, NOW)
+    charts = _charts(minute, hourly)
+
+    monkeypatch.setattr(chart_encoding, 'CHART_STORAGE_FORMAT', 'legacy')
+    legacy = build_chart_document(minute, hourly, charts)
+    assert set(legacy) == set(charts)
+
+    monkeypatch.setattr(chart_encoding, 'CHART_STORAGE_FORMAT', 'compact')
+    assert decode_chart_document(build_chart_document(minute, hourly, charts)) == legacy
@@ -0,0 +1,22 @@
+from document_store import DocumentStore
+
+
+def test_local_file_round_trip(tmp_path):
+    path = str(tmp_path / "store.json")
+    store = DocumentStore("pairs", path=path)
+    assert store.is_local
+    store.set_document("a", {"pair": "0x1"})
+    store.set_documents({"b": {"pair": "0x2"}, "c": {"pair": "0x3"}})
+    store.save()
+
+    reloaded = DocumentStore("pairs", path=path)
+    assert reloaded.get_document("a") == {"pair": "0x1"}
+    assert reloaded.get_document("missing") is None
+    assert reloaded.get_documents(["c", "missing", "b"]) == {"b": {"pair": "0x2"}, "c": {"pair": "0x3"}}
+
+
+def test_without_firestore_documents_stay_in_memory():
+    store = DocumentStore("pairs")
+    store.set_document("a", {"pair": "0x1"})
+    store.save()  # no path: nothing to persist
+    assert store.get_documents(["a"]) == {"a": {"pair": "0x1"}}
@@ -0,0 +1,141 @@
+import datetime
+import random
+
+import pytest
+
+import ohlcv_series
+from ohlcv_series import CandleSeries, format_timestamp, parse_timestamp, plan_ohlcv_pages
+
+START = 1_735_689_600  # 2025-01-01T00:00:00Z
+
+
+def _candles(count: int, step: int = 3600, start: int = START, seed: int = 1) -> list[dict]:
+    rng = random.Random(seed)
+    price = 1.0
+    candles = []
+    for i in range(count):
+        price *= 1 + rng.uniform(-0.05, 0.05)
+        candles.append({'timestamp': format_timestamp(start + i * step), 'open': price,
+                         'high': price * 1.02, 'low': price * 0.98, 'close': price * 1.01,
+                         'volume': rng.uniform(1, 1000)})
+    return candles
+
+
+def _pure_python(monkeypatch, build):
+    """Runs build() with NumPy disabled, as on an install without it."""
+    with monkeypatch.context() as patch:
+        patch.setattr(ohlcv_series, 'np', None)
+        return build()
+
+
+def test_timestamps_round_trip():
+    assert parse_timestamp('2025-01-01T00:00:00.000Z') == START
+    assert format_timestamp(START) == '2025-01-01T00:00:00.000Z'
+
+
+def test_from_candles_sorts_dedupes_and_fills_open_only_candles():
+    series = CandleSeries.from_candles([
+        {'timestamp': format_timestamp(START + 60), 'open': 2.0},
+        {'timestamp': format_timestamp(START), 'open': 1.0, 'high': 3.0, 'low': 0.5, 'close': 1.5, 'volume': 10},
+        {'timestamp': format_timestamp(START + 60), 'open': 4.0},
+        {'timestamp': None, 'open': 9.0},
+    ])
+    assert series.to_candles() == [
+        {'timestamp': format_timestamp(START), 'open': 1.0, 'high': 3.0, 'low': 0.5, 'close': 1.5, 'volume': 10.0},
+        {'timestamp': format_timestamp(START + 60), 'open': 4.0, 'high': 4.0, 'low': 4.0, 'close': 4.0, 'volume': 0.0},
+    ]
+
+
+@pytest.mark.parametrize("target_points", [0, 1, 2, 3, 50, 168, 400])
+def test_numpy_and_pure_python_paths_agree(monkeypatch, target_points):
+    pytest.importorskip('numpy')
+    older = _candles(336)
+    # Overlaps the last 100 hours of `older` with different prices.
+    newer = _candles(200, start=START + 236 * 3600, seed=2)
+    since = START + 100 * 3600
+
+    def build():
+        series = CandleSeries.from_candles(older).merge(CandleSeries.from_candles(newer))
+        return (series.to_candles(),
+                series.since(since).to_candles(),
+                series.tail(24).to_candles(),
+                series.lttb(target_points).to_candles(),
+                series.last_timestamp)
+
+    with_numpy = build()
+    without_numpy = _pure_python(monkeypatch, build)
+    assert with_numpy == without_numpy
+
+
+def test_merge_prefers_the_newer_series():
+    older = CandleSeries.from_candles([{'timestamp': format_timestamp(START + i * 60), 'open': 1.0} for i in range(3)])
+    newer = CandleSeries.from_candles([{'timestamp': format_timestamp(START + i * 60), 'open': 2.0} for i in range(2, 5)])
+    merged = older.merge(newer)
+    assert [int(ts) for ts in merged.timestamps] == [START + i * 60 for i in range(5)]
+    assert [float(value) for value in merged.open] == [1.0, 1.0, 2.0, 2.0, 2.0]
+
+
+def test_lttb_keeps_first_last_and_spike():
+    candles = [{'timestamp': format_timestamp(START + i * 3600), 'open': 1.0} for i in range(300)]
+    candles[150]['open'] = 50.0
+    thinned = CandleSeries.from_candles(candles).lttb(20)
+    timestamps = [int(ts) for ts in thinned.timestamps]
+    assert len(thinned) == 20
+    assert timestamps[0] == START and timestamps[-1] == START + 299 * 3600
+    assert max(float(value) for value in thinned.open) == 50.0
+
+
+# --- Page planning ---
+
+def _utc(epoch: float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(epoch, tz=datetime.timezone.utc)
+
+
+def _candles_in(pages, step: int) -> list[int]:
+    """Candle timestamps each page would return, i.e. the boundaries inside [from, to]."""
+    counts = []
+    for page_from, page_to in pages:
+        first = -(-int(page_from.timestamp() * 1000) // (step * 1000)) * step
+        counts.append(len(range(first, int(page_to.timestamp()) + 1, step)))
+    return counts
+
+
+def test_empty_or_inverted_range_has_no_pages():
+    assert plan_ohlcv_pages(_utc(START), _utc(START), 'minute', 1000) == []
+    assert plan_ohlcv_pages(_utc(START + 60), _utc(START), 'minute', 1000) == []
+
+
+@pytest.mark.parametrize("candles, expected_pages", [
+    (1, 1),
+    (999, 1),
+    (1000, 1),   # last candle sits exactly on the first page's end boundary
+    (1001, 2),
+    (2000, 2),
+    (2001, 3),
+])
+def test_pages_split_at_the_limit(candles, expected_pages):
+    step, limit = 60, 1000
+    from_date = _utc(START)
+    # `candles` boundaries fall in [from_date, to_date]; the first is START itself.
+    to_date = _utc(START + (candles - 1) * step + 30)
+    pages = plan_ohlcv_pages(from_date, to_date, 'minute', limit)
+
+    assert len(pages) == expected_pages
+    assert pages[0][0] == from_date and pages[-1][1] == to_date
+    counts = _candles_in(pages, step)
+    assert sum(counts) == candles
+    assert all(count <= limit for count in counts)
+
+
+def test_pages_are_contiguous_without_overlap():
+    from_date = _utc(START + 17.5)  # not on a candle boundary
+    to_date = _utc(START + 3600 * 2500)
+    pages = plan_ohlcv_pages(from_date, to_date, 'hour', 1000)
+
+    assert len(pages) == 3
+    for (_, previous_to), (next_from, _) in zip(pages, pages[1:]):
+        assert next_from - previous_to == datetime.timedelta(milliseconds=1)
+        # Inner pages start on a candle boundary.
+        assert next_from.timestamp() % 3600 == 0
+    counts = _candles_in(pages, 3600)
+    assert counts == [1000, 1000, 500]
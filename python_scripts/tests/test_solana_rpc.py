@@ -0,0 +1,60 @@
+import socket
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("solana")
+
+from solders.pubkey import Pubkey
+
+import solana_rpc
+from fake_solana_rpc import FAKE_BALANCE_LAMPORTS, FakeRpcHandler
+from solana_rpc import SolanaRpcManager
+
+
+@pytest.fixture
+def fake_rpc_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeRpcHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def dead_url():
+    # A port that was free a moment ago refuses connections.
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+def _get_balance(client):
+    return client.get_balance(Pubkey.default()).value
+
+
+def test_fails_over_to_the_next_endpoint_and_cools_the_dead_one_down(monkeypatch, fake_rpc_url, dead_url):
+    monkeypatch.setattr(solana_rpc, "SOLANA_RPC_TIMEOUT", 2.0)
+    manager = SolanaRpcManager(lambda secret_id: None, urls=f"{dead_url},{fake_rpc_url}")
+
+    assert manager.call(_get_balance) == FAKE_BALANCE_LAMPORTS
+    dead, alive = manager._get_endpoints()
+    assert not dead.is_available()
+    assert alive.is_available()
+    # Later requests skip the endpoint while it cools down.
+    assert manager.client() is alive.client
+
+
+def test_placeholders_are_filled_from_secrets(fake_rpc_url):
+    manager = SolanaRpcManager({"RPC_PATH": "rpc"}.get, urls=fake_rpc_url + "/{RPC_PATH}")
+    assert manager.call(_get_balance) == FAKE_BALANCE_LAMPORTS
+    assert manager._get_endpoints()[0].url == fake_rpc_url + "/rpc"
+
+
+def test_missing_secrets_leave_no_endpoint():
+    manager = SolanaRpcManager(lambda secret_id: None, urls="http://127.0.0.1:1/?api-key={HELIUS_API_KEY}")
+    with pytest.raises(RuntimeError):
+        manager.call(_get_balance)
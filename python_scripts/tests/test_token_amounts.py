@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from token_amounts import MAX_AMOUNT_DIGITS, MAX_AMOUNT_EXPONENT, to_base_units
+
+
+@pytest.mark.parametrize("amount, expected", [
+    ("1", 10 ** 18),
+    ("0.05", 5 * 10 ** 16),
+    ("1e-3", 10 ** 15),
+    (".5", 5 * 10 ** 17),
+    ("2.", 2 * 10 ** 18),
+    ("1.5E2", 150 * 10 ** 18),
+    ("0.0000000000000000019", 1),  # truncated past 18 decimals
+    ("0", 0),
+    (0.25, 25 * 10 ** 16),
+])
+def test_converts_decimal_amounts(amount, expected):
+    assert to_base_units(amount, 18) == expected
+
+
+@pytest.mark.parametrize("amount", ["", ".", "abc", "-1", "1e", "1.2.3", "0x10"])
+def test_rejects_malformed_amounts(amount):
+    with pytest.raises(ValueError):
+        to_base_units(amount, 18)
+
+
+@pytest.mark.parametrize("amount", ["1e-2000000", "1e-999999999", "1e999999999", f"1e{MAX_AMOUNT_EXPONENT + 1}"])
+def test_rejects_out_of_range_exponents_without_computing_them(amount):
+    start = time.perf_counter()
+    with pytest.raises(ValueError):
+        to_base_units(amount, 18)
+    assert time.perf_counter() - start < 0.1
+
+
+def test_rejects_too_many_significant_digits():
+    with pytest.raises(ValueError):
+        to_base_units("1" * (MAX_AMOUNT_DIGITS + 1), 18)
+    # Leading zeros are not significant.
+    assert to_base_units("0" * 200 + "1", 18) == 10 ** 18
+
+
+def test_amounts_below_one_base_unit_are_zero_without_a_power():
+    start = time.perf_counter()
+    assert to_base_units("0." + "0" * 1_000_000 + "1", 18) == 0
+    assert to_base_units(f"1e-{MAX_AMOUNT_EXPONENT}", 18) == 0
+    assert time.perf_counter() - start < 0.5
+
+
+def test_exponent_bounds_are_inclusive():
+    assert to_base_units(f"1e{MAX_AMOUNT_EXPONENT}", 18) == 10 ** (MAX_AMOUNT_EXPONENT + 18)
+    assert to_base_units("1e-18", 18) == 1
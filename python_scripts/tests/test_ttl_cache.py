@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+from ttl_cache import TTLCache
+
+
+def test_concurrent_misses_share_one_loader_call():
+    cache = TTLCache(maxsize=10, ttl=60)
+    calls = []
+    release = threading.Event()
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("key", loader))) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    # Let every thread reach the cache before the loader returns.
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == ["value"] * 16
+    assert cache.get("key") == "value"
+
+
+def test_loader_errors_reach_every_waiter_and_are_not_cached():
+    cache = TTLCache(maxsize=10, ttl=60)
+    release = threading.Event()
+
+    def failing_loader():
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    errors = []
+
+    def call():
+        try:
+            cache.get_or_load("key", failing_loader)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 4
+    assert cache.get_or_load("key", lambda: "recovered") == "recovered"
+
+
+def test_stale_entry_is_served_while_one_background_reload_runs():
+    cache = TTLCache(maxsize=10, ttl=0.05, stale_ttl=60)
+    cache.put("key", "old")
+    time.sleep(0.1)
+
+    calls = []
+    release = threading.Event()
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return "new"
+
+    start = time.perf_counter()
+    assert cache.get_or_load("key", loader) == "old"
+    assert cache.get_or_load("key", loader) == "old"
+    assert time.perf_counter() - start < 1
+    # Stale values are not returned by a plain get.
+    assert cache.get("key") is None
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while cache.get("key") is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.get("key") == "new"
+    assert len(calls) == 1
+
+
+def test_entries_past_the_stale_window_are_reloaded_inline():
+    cache = TTLCache(maxsize=10, ttl=0.01, stale_ttl=0.01)
+    cache.put("key", "old")
+    time.sleep(0.05)
+    assert cache.get_or_load("key", lambda: "new") == "new"
+
+
+def test_rejected_values_are_returned_but_not_stored():
+    cache = TTLCache(maxsize=10, ttl=60)
+    assert cache.get_or_load("key", lambda: None) is None
+    assert len(cache) == 0
+
+
+@pytest.mark.parametrize("maxsize", [1, 3])
+def test_least_recently_used_entries_are_evicted(maxsize):
+    cache = TTLCache(maxsize=maxsize, ttl=60)
+    for i in range(maxsize + 1):
+        cache.put(i, str(i))
+    assert len(cache) == maxsize
+    assert cache.get(0) is None
+    assert cache.get(maxsize) == str(maxsize)
@@ -0,0 +1,40 @@
+import re
+
+# --- Token Amounts ---
+# Parsing of the human-readable amounts accepted by the router (weth_amount_to_spend,
+# weth_amounts_to_spend) into integer base units for the swap APIs.
+
+_DECIMAL_AMOUNT = re.compile(r"^(\d*)(?:\.(\d*))?(?:[eE]([+-]?\d+))?$")
+# Amounts come straight from request parameters, so exponents and significant digits
+# are bounded before any power of ten is computed (2^256 has 78 digits).
+MAX_AMOUNT_EXPONENT = 40
+MAX_AMOUNT_DIGITS = 78
+
+
+def to_base_units(amount, decimals: int) -> int:
+    """
+    Converts a human-readable amount ("0.05", "1e-3") to integer base units
+    (e.g. wei) with exact integer arithmetic, truncating digits beyond `decimals`.
+    Raises ValueError for malformed amounts and for exponents or digit counts
+    beyond MAX_AMOUNT_EXPONENT / MAX_AMOUNT_DIGITS.
+    """
+    match = _DECIMAL_AMOUNT.match(str(amount).strip())
+    if not match or not (match.group(1) or match.group(2)):
+        raise ValueError(f"Invalid amount: {amount}")
+    whole, fraction, exponent_text = match.group(1) or "", match.group(2) or "", match.group(3) or "0"
+    exponent = int(exponent_text)
+    if abs(exponent) > MAX_AMOUNT_EXPONENT:
+        raise ValueError(f"Amount exponent out of range: {amount}")
+    significant = (whole + fraction).lstrip("0")
+    if len(significant) > MAX_AMOUNT_DIGITS:
+        raise ValueError(f"Amount has too many digits: {amount}")
+    if not significant:
+        return 0
+    digits = int(significant)
+    scale = decimals - len(fraction) + exponent
+    if scale >= 0:
+        return digits * 10 ** scale
+    if -scale > len(significant):
+        # Every significant digit is below one base unit.
+        return 0
+    return digits // 10 ** -scale
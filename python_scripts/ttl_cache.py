@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+import metrics
+
+
+class _Flight:
+    """One in-progress load that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory cache with a time-to-live, LRU eviction, single-flight
+    loading and stale-while-revalidate.
+
+    - Fresh entries (younger than `ttl`) are returned directly.
+    - Stale entries (younger than `ttl + stale_ttl`) are returned immediately while
+      one background thread reloads them.
+    - On a miss, concurrent callers for the same key share a single loader call.
+    Values rejected by `should_cache` (None by default) are returned but not stored.
+    If `name` is set, hits, stale hits and misses are counted as `<name>_cache_*` metrics.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, stale_ttl: float = 0.0,
+                 should_cache: Callable[[Any], bool] = lambda value: value is not None,
+                 name: Optional[str] = None):
+        self._name = name
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._stale_ttl = stale_ttl
+        self._should_cache = should_cache
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _count(self, outcome: str):
+        if self._name:
+            metrics.increment(f"{self._name}_cache_{outcome}")
+
+    def _lookup(self, key: Hashable):
+        """Returns (value, age) for a stored entry, or None. Caller holds the lock."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        age = time.monotonic() - stored_at
+        if age >= self._ttl + self._stale_ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value, age
+
+    def get(self, key: Hashable):
+        """Returns the fresh value for key, or None."""
+        with self._lock:
+            found = self._lookup(key)
+        if found is not None and found[1] < self._ttl:
+            self._count("hit")
+            return found[0]
+        self._count("miss")
+        return None
+
+    def put(self, key: Hashable, value):
+        if not self._should_cache(value):
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def _run_flight(self, key: Hashable, flight: _Flight, loader: Callable[[], Any]):
+        try:
+            flight.value = loader()
+            self.put(key, flight.value)
+        except BaseException as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def _join_flight(self, key: Hashable):
+        """Returns (flight, is_leader). Caller holds the lock."""
+        flight = self._inflight.get(key)
+        if flight is not None:
+            return flight, False
+        flight = _Flight()
+        self._inflight[key] = flight
+        return flight, True
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]):
+        with self._lock:
+            found = self._lookup(key)
+            if found is not None:
+                value, age = found
+                if age < self._ttl:
+                    self._count("hit")
+                    return value
+                # Stale: serve it now and refresh once in the background.
+                self._count("stale")
+                flight, is_leader = self._join_flight(key)
+                if is_leader:
+                    threading.Thread(target=self._run_flight, args=(key, flight, loader), daemon=True).start()
+                return value
+            flight, is_leader = self._join_flight(key)
+
+        self._count("miss")
+        if is_leader:
+            self._run_flight(key, flight, loader)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
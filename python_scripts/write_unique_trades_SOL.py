@@ -7,11 +7,24 @@ from google.cloud import firestore
 import firebase_admin
 from firebase_admin import credentials, firestore, storage
 from moralis import sol_api
-import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from http_transport import backoff_delay, is_transient_moralis_error
+from logo_index import LogoIndex, sync_logos
+from logo_thumbnails import thumbnail_pool
+from metadata_cache import MetadataCache, load_token_metadata
+from rate_limiter import TokenBucket
 
 # Moralis API Key (replace with your actual key)
 moralis_api_key = "x"
 
+# Metadata enrichment: concurrent calls, calls per second across all of them, and attempts per mint
+SOL_METADATA_WORKERS = int(os.environ.get("SOL_METADATA_WORKERS", "16"))
+SOL_METADATA_CALLS_PER_SECOND = float(os.environ.get("SOL_METADATA_CALLS_PER_SECOND", "25"))
+SOL_METADATA_MAX_ATTEMPTS = int(os.environ.get("SOL_METADATA_MAX_ATTEMPTS", "3"))
+
 query = """
 {
   Solana {
@@ -42,169 +55,174 @@ headers = {
    'Authorization': 'Bearer x'
 }
 
-response = requests.post(url, headers=headers, json={'query': query})
-
-if response.status_code == 200:
-    data = response.json()
-else:
-    print(f"Error executing query: {response.status_code}")
-    print(response.text)
-
-# Extracting the data
-counter = 1
-trades = []
-token_addresses = []
-
-for item in data["data"]["Solana"]["DEXTradeByTokens"]:
-    if len(str(item["Trade"]["Currency"]["Name"])) == 0 or len(str(item["Trade"]["Currency"]["Symbol"])) == 0:
-        continue
-
-    trade_info = {
-        "Counter": counter,
-        "Name": item["Trade"]["Currency"]["Name"],
-        "SmartContract": item["Trade"]["Currency"]["MintAddress"],
-        "Symbol": item["Trade"]["Currency"]["Symbol"]
-    }
-    trades.append(trade_info)
-    token_addresses.append(item["Trade"]["Currency"]["MintAddress"])
-    counter += 1
-
-# Creating the new JSON structure
-new_json = {"trades": trades}
-
 # --- Moralis API Integration ---
-moralis_token_metadata = {}
+# Metadata comes from the persistent metadata cache where it is still fresh. The
+# Solana metadata endpoint takes one mint per call, so the remaining mints are
+# fetched concurrently on a bounded pool. All workers share one rate limiter, each
+# mint is retried with backoff on rate limits, outages and connection errors (other
+# errors fail at once), and a mint that still fails is only logged, so one bad mint
+# never costs the others their metadata.
+metadata_rate_limiter = TokenBucket(rate=SOL_METADATA_CALLS_PER_SECOND)
 
-# Iterate through token_addresses in chunks of batch_size
-for address in token_addresses:
 
+def fetch_sol_token_metadata(address):
     moralis_params = {
         "address": address,
         "network": "mainnet",
     }
-    try:
-        # Make a batch call to Moralis for the current chunk
-        result = sol_api.token.get_token_metadata(
-            api_key=moralis_api_key,
-            params=moralis_params,
-        )
-
-        moralis_token_metadata[result['mint'].lower()] = result
-
-    except Exception as e:
-        print(f"Error fetching Moralis data for {address}: {e}")
-
-# Enrich trades with Moralis metadata
-for trade in new_json['trades']:
-    address = trade["SmartContract"].lower()
-    token_metadata = moralis_token_metadata.get(address, {})
-
-    trade['logo'] = token_metadata.get('logo', "")
-    trade['circulating_supply'] = token_metadata.get('totalSupplyFormatted', "")
-    trade['market_cap'] = token_metadata.get('fullyDilutedValue', "")
-
-    # Extracting twitter, website, and description
-    links = token_metadata.get('links', {})
-    trade['twitter_link'] = links.get('twitter', "")
-    trade['website_link'] = links.get('website', "")
-    trade['description'] = token_metadata.get('description', "")
-
-# --- Firebase Initialization (ensure it's initialized only once) ---
-try:
-    cred = credentials.Certificate('meme-hunter-4f1c1-firebase-adminsdk-8if09-b0eff4234b.json')
-    firebase_admin.initialize_app(cred, {'storageBucket': 'meme-hunter-4f1c1.firebasestorage.app'}) # Add storageBucket
-except ValueError as e:
-    if "The default Firebase app already exists" not in str(e):
-        raise # Re-raise other ValueErrors
-    # If already initialized, ensure storage bucket is associated if needed later
-    print("Firebase app already initialized.")
-
-db = firestore.Client(project='meme-hunter-4f1c1')
-bucket = storage.bucket() # Get the default storage bucket
-
-# --- Image Download and Upload to Firebase Storage ---
-# We'll create a dictionary to store the Firebase Storage URLs to avoid
-# re-downloading/re-uploading the same image multiple times if multiple
-# tokens share the same logo URL.
-uploaded_image_urls = {}
-
-for trade in new_json['trades']:
-    # Skip low market cap tokens
-    if(len(trade['market_cap']) < 4 or float(trade['market_cap']) < 5000):
-        print('skipping ' + trade['Name'] + ' low market cap: ' + trade['market_cap'])
-        continue
-
-    original_logo_url = trade['logo']
-
-    if original_logo_url and original_logo_url.startswith('http'): # Ensure it's a valid URL
-        if original_logo_url in uploaded_image_urls:
-            # Use cached Firebase Storage URL if already uploaded
-            trade['firebase_logo_url'] = uploaded_image_urls[original_logo_url]
-            print(f"Using cached Firebase Storage URL for {original_logo_url}")
-        else:
+    for attempt in range(SOL_METADATA_MAX_ATTEMPTS):
+        metadata_rate_limiter.acquire()
+        try:
+            return sol_api.token.get_token_metadata(
+                api_key=moralis_api_key,
+                params=moralis_params,
+            )
+        except Exception as e:
+            # Unknown or invalid mints (400/404) fail at once; only rate limits,
+            # outages and connection errors are worth another call.
+            if not is_transient_moralis_error(e) or attempt + 1 >= SOL_METADATA_MAX_ATTEMPTS:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Error fetching Moralis data for {address} (attempt {attempt + 1}): {e}. Retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def fetch_moralis_metadata(addresses):
+    fetched = {}
+    with ThreadPoolExecutor(max_workers=SOL_METADATA_WORKERS) as executor:
+        futures = {executor.submit(fetch_sol_token_metadata, address): address for address in addresses}
+        for future in as_completed(futures):
             try:
-                # 1. Download the image
-                print(f"Attempting to download: {original_logo_url}")
-                image_response = requests.get(original_logo_url, stream=True)
-                image_response.raise_for_status() # Raise an exception for bad status codes
-
-                # Extract content type (e.g., 'image/webp') and determine file extension
-                content_type = image_response.headers.get('Content-Type', 'application/octet-stream')
-                file_extension = 'webp' # Default or derive from content_type
-                if 'image/' in content_type:
-                    file_extension = content_type.split('/')[-1].replace('jpeg', 'jpg').split(';')[0]
-
-                image_data = io.BytesIO(image_response.content) # Store image data in memory
-
-                # 2. Upload to Firebase Storage
-                # Create a unique filename (e.g., smart_contract_address.webp)
-                # You might want to sanitize the address for filenames
-                filename = f"logos_SOL/{trade['SmartContract']}.{file_extension}"
-                blob = bucket.blob(filename)
-
-                # Set content type based on what was detected or expected
-                blob.upload_from_file(image_data, content_type=content_type)
-                blob.make_public() # Make the image publicly accessible
-
-                # Get the public URL
-                firebase_storage_url = blob.public_url
-                trade['firebase_logo_url'] = firebase_storage_url
-                uploaded_image_urls[original_logo_url] = firebase_storage_url # Cache the URL
-                print(f"Uploaded {original_logo_url} to {firebase_storage_url}")
-
-            except requests.exceptions.RequestException as e:
-                print(f"Error downloading image {original_logo_url}: {e}")
-                trade['firebase_logo_url'] = "" # Set to empty if download fails
+                fetched[futures[future]] = future.result()
             except Exception as e:
-                print(f"Error uploading image {original_logo_url} to Firebase Storage: {e}")
-                trade['firebase_logo_url'] = "" # Set to empty if upload fails
+                print(f"Error fetching Moralis data for {futures[future]}: {e}")
+    return fetched
+
+
+def main():
+    response = requests.post(url, headers=headers, json={'query': query})
+
+    if response.status_code == 200:
+        data = response.json()
     else:
-        trade['firebase_logo_url'] = "" # No valid logo URL
-
-    # Remove the original 'logo' field if you only want the Firebase URL
-    # Or keep it if you want both for debugging/fallback
-    if 'logo' in trade:
-        del trade['logo']
-
-# Get current date and hour, zeroing out minutes and seconds
-current_time = datetime.now().replace(minute=0, second=0, microsecond=0)
-timestamp = current_time.isoformat()
-
-# Initialize Firestore client
-db = firestore.Client(project='meme-hunter-4f1c1') # Hardcoded project ID
-
-# Write data to Firestore
-for trade in new_json['trades']:
-    # Skip low market cap tokens
-    if(len(trade['market_cap']) < 4 or float(trade['market_cap']) < 5000):
-        print('skipping ' + trade['Name'] + ' low market cap: ' + trade['market_cap'])
-        continue
-
-    # Generate a unique ID for each document
-    doc_ref = db.collection('tokens_by_timestamp_SOL').document()  # Generate a unique ID
-    # Add timestamp field
-    trade['timestamp'] = timestamp
-    # Set the document in Firestore
-    doc_ref.set(trade)
-
-print('complete')
+        print(f"Error executing query: {response.status_code}")
+        print(response.text)
+        return # Stop if BitQuery fails
+
+    # Extracting the data
+    counter = 1
+    trades = []
+    token_addresses = []
+
+    for item in data["data"]["Solana"]["DEXTradeByTokens"]:
+        if len(str(item["Trade"]["Currency"]["Name"])) == 0 or len(str(item["Trade"]["Currency"]["Symbol"])) == 0:
+            continue
+
+        trade_info = {
+            "Counter": counter,
+            "Name": item["Trade"]["Currency"]["Name"],
+            "SmartContract": item["Trade"]["Currency"]["MintAddress"],
+            "Symbol": item["Trade"]["Currency"]["Symbol"]
+        }
+        trades.append(trade_info)
+        token_addresses.append(item["Trade"]["Currency"]["MintAddress"])
+        counter += 1
+
+    # Creating the new JSON structure
+    new_json = {"trades": trades}
+
+    # --- Firebase Initialization (ensure it's initialized only once) ---
+    try:
+        cred = credentials.Certificate('meme-hunter-4f1c1-firebase-adminsdk-8if09-b0eff4234b.json')
+        firebase_admin.initialize_app(cred, {'storageBucket': 'meme-hunter-4f1c1.firebasestorage.app'}) # Add storageBucket
+    except ValueError as e:
+        if "The default Firebase app already exists" not in str(e):
+            raise # Re-raise other ValueErrors
+        # If already initialized, ensure storage bucket is associated if needed later
+        print("Firebase app already initialized.")
+
+    db = firestore.Client(project='meme-hunter-4f1c1')
+    bucket = storage.bucket() # Get the default storage bucket
+
+    metadata_cache = MetadataCache(db)
+    moralis_token_metadata = {
+        address.lower(): metadata
+        for address, metadata in load_token_metadata(metadata_cache, 'sol', token_addresses, fetch_moralis_metadata, moralis_api_key).items()
+    }
+
+    # Enrich trades with Moralis metadata
+    for trade in new_json['trades']:
+        address = trade["SmartContract"].lower()
+        token_metadata = moralis_token_metadata.get(address, {})
+
+        trade['logo'] = token_metadata.get('logo', "")
+        trade['circulating_supply'] = token_metadata.get('totalSupplyFormatted', "")
+        trade['market_cap'] = token_metadata.get('fullyDilutedValue', "")
+
+        # Extracting twitter, website, and description
+        links = token_metadata.get('links', {})
+        trade['twitter_link'] = links.get('twitter', "")
+        trade['website_link'] = links.get('website', "")
+        trade['description'] = token_metadata.get('description', "")
+
+    # --- Image Download and Upload to Firebase Storage ---
+    # Logos go through the persistent logo index (logo_index.py): every distinct logo URL
+    # is re-checked with a conditional request, and only content that is not already in
+    # storage is resized to WebP thumbnails and uploaded. Downloads and uploads run on a
+    # worker pool, image processing on a process pool.
+    logo_trades = []
+    for trade in new_json['trades']:
+        # Skip low market cap tokens
+        if(len(trade['market_cap']) < 4 or float(trade['market_cap']) < 5000):
+            print('skipping ' + trade['Name'] + ' low market cap: ' + trade['market_cap'])
+            continue
+        logo_trades.append(trade)
+
+    logo_urls = [trade['logo'] for trade in logo_trades if trade['logo'] and trade['logo'].startswith('http')] # Ensure it's a valid URL
+    # Thumbnail workers use forkserver/spawn (see logo_thumbnails.thumbnail_pool), so they
+    # start clean however many threads and gRPC channels this process already has.
+    process_pool = thumbnail_pool()
+    try:
+        uploaded_image_urls = sync_logos(LogoIndex(db), bucket, logo_urls, 'logos_SOL', process_pool)
+    finally:
+        if process_pool is not None:
+            process_pool.shutdown()
+
+    for trade in logo_trades:
+        original_logo_url = trade['logo']
+        # Empty if there was no valid logo URL or the download / upload failed
+        logo_urls = uploaded_image_urls.get(original_logo_url, {}) if original_logo_url else {}
+        trade['firebase_logo_url'] = logo_urls.get('firebase_logo_url', "")
+        trade['firebase_logo_small_url'] = logo_urls.get('firebase_logo_small_url', "")
+
+        # Remove the original 'logo' field if you only want the Firebase URL
+        # Or keep it if you want both for debugging/fallback
+        if 'logo' in trade:
+            del trade['logo']
+
+    # Get current date and hour, zeroing out minutes and seconds
+    current_time = datetime.now().replace(minute=0, second=0, microsecond=0)
+    timestamp = current_time.isoformat()
+
+    # Initialize Firestore client
+    db = firestore.Client(project='meme-hunter-4f1c1') # Hardcoded project ID
+
+    # Write data to Firestore
+    for trade in new_json['trades']:
+        # Skip low market cap tokens
+        if(len(trade['market_cap']) < 4 or float(trade['market_cap']) < 5000):
+            print('skipping ' + trade['Name'] + ' low market cap: ' + trade['market_cap'])
+            continue
+
+        # Generate a unique ID for each document
+        doc_ref = db.collection('tokens_by_timestamp_SOL').document()  # Generate a unique ID
+        # Add timestamp field
+        trade['timestamp'] = timestamp
+        # Set the document in Firestore
+        doc_ref.set(trade)
+
+    print('complete')
+
+
+if __name__ == "__main__":
+    main()